@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试数据生成器：按给定规模生成仿真的 Nmap XML 与资产表（xlsx/csv）。
+
+* XML：主机数、每台主机端口数、脚本个数与输出长度、IPv6 / MAC 比例均可配置，
+  结构与 nmap -sV -sC -O -oX 的输出一致（status/address/hostnames/ports/os/times），
+  并按比例混入重复主机，便于衡量去重。
+* 表格：列名可选中文（IP / 端口/协议 / 状态 / 服务 / 端口用途）或英文别名，
+  少量行带非数字端口（如 80-90/tcp），与真实台账中的脏数据相当。
+
+可单独运行：
+    python bench/gen_data.py xml scan.xml --hosts 2500 --ports-per-host 4
+    python bench/gen_data.py table assets.csv --rows 10000
+"""
+import argparse
+import random
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+# 常见端口按出现频率加权，其余端口从高位端口中随机取
+COMMON_PORTS = [
+    (80, "tcp", "http", 20), (443, "tcp", "https", 18), (22, "tcp", "ssh", 15),
+    (3389, "tcp", "ms-wbt-server", 6), (445, "tcp", "microsoft-ds", 6), (139, "tcp", "netbios-ssn", 5),
+    (21, "tcp", "ftp", 4), (23, "tcp", "telnet", 3), (25, "tcp", "smtp", 3), (53, "udp", "domain", 4),
+    (161, "udp", "snmp", 3), (3306, "tcp", "mysql", 4), (1433, "tcp", "ms-sql-s", 2), (6379, "tcp", "redis", 2),
+    (5900, "tcp", "vnc", 2), (8080, "tcp", "http-proxy", 6), (8443, "tcp", "ssl/http", 3), (9200, "tcp", "wap-wsp", 1),
+    (27017, "tcp", "mongod", 1), (11211, "tcp", "memcache", 1),
+]
+_COMMON_WEIGHTS = [w for *_, w in COMMON_PORTS]
+PRODUCTS = ["Apache httpd", "nginx", "OpenSSH", "Microsoft IIS httpd", "MySQL", "Redis key-value store", "vsftpd", ""]
+STATES = (["open"] * 90) + (["filtered"] * 7) + (["closed"] * 3)
+SCRIPT_IDS = ["http-title", "ssl-cert", "ssh-hostkey", "banner", "http-server-header", "smb-os-discovery"]
+REMARKS = ["", "", "", "业务系统", "运维管理", "数据库", "测试环境"]
+
+def host_ip(index, ipv6_ratio, rng):
+    """第 index 台主机的地址：按比例生成 IPv6，否则按序号展开为 10.x.y.z"""
+    if rng.random() < ipv6_ratio:
+        return f"2001:db8::{index >> 16 & 0xffff:x}:{index & 0xffff:x}", "ipv6"
+    return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}", "ipv4"
+
+def pick_ports(rng, count):
+    """选出 count 个不重复的 (端口, 协议, 服务)，常见端口占多数"""
+    chosen = {}
+    while len(chosen) < count:
+        if rng.random() < 0.8:
+            port, proto, service, _ = rng.choices(COMMON_PORTS, weights=_COMMON_WEIGHTS)[0]
+        else:
+            port, proto, service = rng.randint(1024, 65535), "tcp", rng.choice(["unknown", "http", "ssl/unknown"])
+        chosen.setdefault((port, proto), service)
+    return [(port, proto, service) for (port, proto), service in chosen.items()]
+
+def iter_host_xml(index, rng, ports_per_host, scripts, script_bytes, ipv6_ratio, mac_ratio):
+    """生成一台主机的 XML 片段（逐行产出，调用方负责写入）"""
+    ip, addrtype = host_ip(index, ipv6_ratio, rng)
+    yield '<host starttime="1700000000" endtime="1700000100"><status state="up" reason="syn-ack" reason_ttl="0"/>'
+    yield f'<address addr="{ip}" addrtype="{addrtype}"/>'
+    if rng.random() < mac_ratio:
+        mac = ":".join(f"{rng.randrange(256):02X}" for _ in range(6))
+        yield f'<address addr="{mac}" addrtype="mac" vendor="VMware"/>'
+    yield f'<hostnames><hostname name="host{index}.example.internal" type="PTR"/></hostnames>'
+    yield '<ports><extraports state="closed" count="995"><extrareasons reason="resets" count="995"/></extraports>'
+    for port, proto, service in pick_ports(rng, ports_per_host):
+        product = rng.choice(PRODUCTS)
+        yield (f'<port protocol="{proto}" portid="{port}"><state state="{rng.choice(STATES)}" reason="syn-ack" reason_ttl="64"/>'
+               f'<service name="{service}" product={quoteattr(product)} version="{rng.randint(1, 9)}.{rng.randint(0, 20)}" '
+               f'method="probed" conf="10"><cpe>cpe:/a:{service}:{service}</cpe></service>')
+        for sid in rng.sample(SCRIPT_IDS, min(scripts, len(SCRIPT_IDS))):
+            output = escape(("%s %d " % (sid, index)) * max(1, script_bytes // 16))[:script_bytes]
+            yield f'<script id="{sid}" output={quoteattr(output)}><elem key="value">{output}</elem></script>'
+        yield '</port>'
+    yield '</ports>'
+    yield '<os><portused state="open" proto="tcp" portid="22"/><osmatch name="Linux 5.0 - 5.14" accuracy="96" line="1">'
+    yield '<osclass type="general purpose" vendor="Linux" osfamily="Linux" osgen="5.X" accuracy="96"/></osmatch></os>'
+    yield '<distance value="2"/><times srtt="512" rttvar="128" to="100000"/></host>'
+
+def generate_xml(path, hosts, ports_per_host=4, scripts=1, script_bytes=64,
+                 ipv6_ratio=0.1, mac_ratio=0.5, dup_ratio=0.02, seed=1):
+    """写出仿真 Nmap XML，返回写入的端口条数（含重复主机）"""
+    rng = random.Random(seed)
+    ports = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE nmaprun>\n')
+        f.write('<nmaprun scanner="nmap" args="nmap -sV -sC -O -oX scan.xml 10.0.0.0/8" start="1700000000" version="7.94" xmloutputversion="1.05">\n')
+        f.write('<scaninfo type="syn" protocol="tcp" numservices="1000" services="1-1000"/>\n<verbose level="0"/>\n<debugging level="0"/>\n')
+        for i in range(hosts):
+            # 少量主机重复出现（同一 IP 扫了两次），序号取前面已生成的主机
+            index = rng.randrange(i) if i and rng.random() < dup_ratio else i
+            f.write("".join(iter_host_xml(index, rng, ports_per_host, scripts, script_bytes, ipv6_ratio, mac_ratio)))
+            f.write("\n")
+            ports += ports_per_host
+        f.write(f'<runstats><finished time="1700000100" timestr="" elapsed="100" summary="" exit="success"/>'
+                f'<hosts up="{hosts}" down="0" total="{hosts}"/></runstats>\n</nmaprun>\n')
+    return ports
+
+TABLE_HEADERS = {
+    "zh": ["IP", "端口/协议", "状态", "服务", "端口用途"],
+    "en": ["host", "port", "state", "service", "remark"],
+}
+
+def iter_table_rows(rows, seed=1, odd_ratio=0.001):
+    """资产表行：(IP, 端口/协议, 状态, 服务, 端口用途)"""
+    rng = random.Random(seed)
+    for i in range(rows):
+        index = rng.randrange(max(1, rows // 3))
+        port, proto, service = pick_ports(rng, 1)[0]
+        port_text = "80-90" if rng.random() < odd_ratio else str(port)
+        yield (f"172.16.{index >> 8 & 255}.{index & 255}", f"{port_text}/{proto}", "open", service, rng.choice(REMARKS))
+
+def generate_table(path, rows, style="zh", seed=1):
+    """写出资产表（按扩展名 .xlsx 或 .csv），返回行数"""
+    header = TABLE_HEADERS[style]
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(header)
+        for row in iter_table_rows(rows, seed):
+            ws.append(row)
+        wb.save(path)
+    else:
+        import csv
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(iter_table_rows(rows, seed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="生成基准测试用的 Nmap XML / 资产表")
+    sub = parser.add_subparsers(dest="kind", required=True)
+    px = sub.add_parser("xml", help="生成 Nmap XML")
+    px.add_argument("path")
+    px.add_argument("--hosts", type=int, default=2500)
+    px.add_argument("--ports-per-host", type=int, default=4)
+    px.add_argument("--scripts", type=int, default=1, help="每个端口的 NSE 脚本个数")
+    px.add_argument("--script-bytes", type=int, default=64, help="每个脚本输出的长度")
+    px.add_argument("--ipv6-ratio", type=float, default=0.1)
+    px.add_argument("--mac-ratio", type=float, default=0.5)
+    px.add_argument("--dup-ratio", type=float, default=0.02, help="重复主机比例")
+    px.add_argument("--seed", type=int, default=1)
+    pt = sub.add_parser("table", help="生成资产表（.xlsx / .csv）")
+    pt.add_argument("path")
+    pt.add_argument("--rows", type=int, default=10000)
+    pt.add_argument("--style", choices=list(TABLE_HEADERS), default="zh", help="列名风格：中文或英文别名")
+    pt.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.kind == "xml":
+        n = generate_xml(args.path, args.hosts, args.ports_per_host, args.scripts, args.script_bytes,
+                         args.ipv6_ratio, args.mac_ratio, args.dup_ratio, args.seed)
+    else:
+        n = generate_table(args.path, args.rows, args.style, args.seed)
+    print(f"已生成 {args.path}：{n} 行", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
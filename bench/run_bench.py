@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+nmap.py 各阶段基准测试。
+
+每个规模在独立子进程中运行（峰值内存互不影响），依次计时：
+    merge_all_xml -> parse_nmap_xml -> parse_table -> to_frame -> auto_dedup
+    -> mark_dangerous -> write_excel -> format_excel
+记录每阶段的耗时、输入/输出行数、行/秒以及阶段结束时的进程峰值 RSS，结果写成 JSON，
+可用 --compare 与上一次的结果比较，耗时超过阈值的阶段视为回退。
+
+用法：
+    python bench/run_bench.py                                  # 默认 10k,100k,1m 端口
+    python bench/run_bench.py --sizes 10k,10m -o bench.json    # 10m 需要数 GB 磁盘与内存
+    python bench/run_bench.py --compare old.json -o new.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+def parse_size(text):
+    """10k / 2.5m / 10000 -> 端口数"""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+class StageTimer:
+    """依次记录各阶段：耗时、输入/输出行数、行/秒、阶段结束时的峰值 RSS（rss 为取峰值的函数）"""
+    def __init__(self, rss):
+        self.stages = []
+        self.rss = rss
+
+    def run(self, name, func, rows_in=None, count=len):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        rows_out = count(result) if count else None
+        rows = rows_in if rows_in is not None else rows_out
+        self.stages.append({
+            "stage": name,
+            "seconds": round(seconds, 4),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "rows_per_sec": round(rows / seconds) if rows and seconds > 0 else None,
+            "peak_rss_mb": self.rss(),
+        })
+        return result
+
+    def skip(self, name, reason):
+        self.stages.append({"stage": name, "skipped": reason})
+
+def run_size(ports, args, workdir):
+    """在当前（子）进程里生成数据并跑完一个规模的所有阶段"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    import logging
+    import nmap
+    from gen_data import generate_xml, generate_table
+
+    # 只保留错误日志，避免 INFO 输出影响计时
+    nmap.logger.setLevel(logging.ERROR)
+    for handler in nmap.logger.handlers:
+        handler.setLevel(logging.ERROR)
+
+    hosts = max(1, ports // args.ports_per_host)
+    table_rows = int(ports * args.table_ratio)
+    xml_path = os.path.join(workdir, "scan.xml")
+    table_path = os.path.join(workdir, f"assets.{args.table_format}")
+
+    start = time.perf_counter()
+    xml_ports = generate_xml(xml_path, hosts, args.ports_per_host, args.scripts, args.script_bytes,
+                             args.ipv6_ratio, args.mac_ratio, args.dup_ratio, args.seed)
+    if table_rows:
+        generate_table(table_path, table_rows, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+
+    timer = StageTimer(nmap.peak_rss_mb)
+    timer.run("merge_all_xml", lambda: nmap.merge_all_xml(os.path.join(workdir, "merged.xml"), [xml_path]),
+              rows_in=xml_ports, count=None)
+    records = timer.run("parse_nmap_xml", lambda: nmap.parse_source(("xml", xml_path), progress=False),
+                        rows_in=xml_ports)
+    if table_rows:
+        table = timer.run("parse_table", lambda: nmap.RecordColumns.from_frame(nmap.parse_table(table_path)),
+                          rows_in=table_rows)
+        records.extend(table)
+        del table
+    else:
+        timer.skip("parse_table", "table_ratio=0")
+    df = timer.run("to_frame", records.to_frame, rows_in=len(records))
+    del records
+    df = timer.run("auto_dedup", lambda: nmap.auto_dedup(df)[0], rows_in=len(df))
+    df = timer.run("mark_dangerous", lambda: nmap.mark_dangerous(df), rows_in=len(df))
+    report = os.path.join(workdir, "report.xlsx")
+    if args.skip_excel:
+        timer.skip("write_excel", "--skip-excel")
+        timer.skip("format_excel", "--skip-excel")
+    else:
+        timer.run("write_excel", lambda: nmap.write_excel(df, report), rows_in=len(df), count=None)
+        # format_excel 会把整本工作簿读进内存，只在较小规模下测
+        if len(df) <= args.format_excel_limit:
+            timer.run("format_excel", lambda: nmap.format_excel(report), rows_in=len(df), count=None)
+        else:
+            timer.skip("format_excel", f"rows > {args.format_excel_limit}")
+
+    return {
+        "ports": ports,
+        "hosts": hosts,
+        "table_rows": table_rows,
+        "xml_mb": round(os.path.getsize(xml_path) / (1024 * 1024), 1),
+        "generate_seconds": round(generate_seconds, 2),
+        "final_rows": len(df),
+        "stages": timer.stages,
+    }
+
+def run_child(ports, args):
+    """在子进程中运行一个规模，返回其结果（子进程通过临时 JSON 回传）"""
+    workdir = tempfile.mkdtemp(prefix=f"nmap-bench-{ports}-", dir=args.workdir)
+    result_path = os.path.join(workdir, "result.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(ports), "--child-out", result_path]
+    for key in ("ports_per_host", "table_ratio", "table_format", "scripts", "script_bytes", "ipv6_ratio",
+                "mac_ratio", "dup_ratio", "seed", "format_excel_limit"):
+        cmd += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+    if args.skip_excel:
+        cmd.append("--skip-excel")
+    try:
+        proc = subprocess.run(cmd, cwd=workdir)
+        if proc.returncode != 0:
+            return {"ports": ports, "error": f"子进程退出码 {proc.returncode}"}
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    versions = {}
+    for name in ("pandas", "numpy", "openpyxl", "pyarrow"):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git": git_revision(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        **versions,
+    }
+
+def print_run(run):
+    if "error" in run:
+        print(f"[{run['ports']:,} 端口] 失败: {run['error']}")
+        return
+    print(f"[{run['ports']:,} 端口 / {run['hosts']:,} 主机 / 表格 {run['table_rows']:,} 行, XML {run['xml_mb']} MB]")
+    for s in run["stages"]:
+        if "skipped" in s:
+            print(f"  {s['stage']:<16} 跳过（{s['skipped']}）")
+            continue
+        rate = f"{s['rows_per_sec']:>12,} 行/秒" if s["rows_per_sec"] else " " * 16
+        rss = f"{s['peak_rss_mb']:>8} MB" if s["peak_rss_mb"] is not None else ""
+        print(f"  {s['stage']:<16} {s['seconds']:>9.3f} s {rate}  峰值 RSS {rss}")
+
+def compare(current, previous, threshold):
+    """按 (规模, 阶段) 对比耗时，返回回退（慢于 threshold 倍）的条目数"""
+    old = {(r["ports"], s["stage"]): s for r in previous.get("runs", []) for s in r.get("stages", [])}
+    regressions = 0
+    print(f"\n与基线对比（阈值 {threshold:.2f}x）：")
+    for run in current["runs"]:
+        for s in run.get("stages", []):
+            prev = old.get((run["ports"], s["stage"]))
+            if not prev or "seconds" not in s or "seconds" not in prev or not prev["seconds"]:
+                continue
+            ratio = s["seconds"] / prev["seconds"]
+            flag = "  <-- 回退" if ratio > threshold else ""
+            regressions += bool(flag)
+            print(f"  {run['ports']:>12,} {s['stage']:<16} {prev['seconds']:>9.3f} -> {s['seconds']:>9.3f} s ({ratio:.2f}x){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="nmap.py 各阶段基准测试（耗时 / 行每秒 / 峰值 RSS）")
+    parser.add_argument("--sizes", default="10k,100k,1m", help="端口规模列表，逗号分隔（默认 10k,100k,1m；可到 10m）")
+    parser.add_argument("--output", "-o", default=None, help="结果 JSON 路径（默认 bench-<时间>.json）")
+    parser.add_argument("--compare", help="与之前的结果 JSON 比较")
+    parser.add_argument("--threshold", type=float, default=1.2, help="判定回退的耗时倍数（默认 1.2）")
+    parser.add_argument("--ports-per-host", type=int, default=4)
+    parser.add_argument("--table-ratio", type=float, default=0.1, help="资产表行数占端口数的比例（默认 0.1，0 表示不测表格）")
+    parser.add_argument("--table-format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--scripts", type=int, default=1)
+    parser.add_argument("--script-bytes", type=int, default=64)
+    parser.add_argument("--ipv6-ratio", type=float, default=0.1)
+    parser.add_argument("--mac-ratio", type=float, default=0.5)
+    parser.add_argument("--dup-ratio", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--format-excel-limit", type=int, default=200_000, help="超过该行数时跳过 format_excel")
+    parser.add_argument("--skip-excel", action="store_true", help="不测 Excel 写出")
+    parser.add_argument("--workdir", default=None, help="临时数据目录（默认系统临时目录）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的数据与报表")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        result = run_size(args.child, args, os.getcwd())
+        with open(args.child_out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    results = {"environment": environment(), "params": {k: v for k, v in vars(args).items() if not k.startswith("child")}, "runs": []}
+    for ports in sizes:
+        run = run_child(ports, args)
+        results["runs"].append(run)
+        print_run(run)
+
+    output = args.output or f"bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,6 @@
 import os
 import re
-import pandas as pd
 import xml.etree.ElementTree as ET
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from tqdm import tqdm
 import logging
 import sys
 import argparse
@@ -12,6 +8,38 @@ import unicodedata
 import textwrap
 import tempfile
 import shutil
+import sqlite3
+import hashlib
+import json
+import zlib
+import codecs
+import fnmatch
+import importlib.util
+import ipaddress
+import time
+import signal
+import stat
+from array import array
+from functools import lru_cache, partial
+from bisect import bisect_right
+
+class _LazyModule:
+    """
+    延迟导入：pandas / numpy 导入就要近一秒，只转换一个小 XML 时根本用不到。
+    首次访问属性时才真正导入，并把模块级名字替换为真实模块，之后的访问没有额外开销。
+    openpyxl、tqdm、进程池、saxutils（会连带导入 urllib）在用到它们的函数里就地导入。
+    """
+    def __init__(self, alias, name):
+        self._alias = alias
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+np = _LazyModule("np", "numpy")
+pd = _LazyModule("pd", "pandas")
 
 # ===========================
 # 日志配置（默认仅输出到控制台）
@@ -170,14 +198,15 @@ dangerous_services = {
 # ===========================
 # 校验 IP（返回 bool）
 # ===========================
+IPV4_PATTERN = re.compile(r"^(25[0-5]|2[0-4]\d|[01]?\d\d?)"
+                          r"(\.(25[0-5]|2[0-4]\d|[01]?\d\d?)){3}$")
+IPV6_PATTERN = re.compile(r"^([0-9a-fA-F]{0,4}:){2,7}[0-9a-fA-F]{0,4}$")
+
 def is_valid_ip(ip: str) -> bool:
     if not ip or str(ip).strip() == '':
         return False
     ip = str(ip).strip()
-    ipv4_pattern = r"^(25[0-5]|2[0-4]\d|[01]?\d\d?)" \
-                   r"(\.(25[0-5]|2[0-4]\d|[01]?\d\d?)){3}$"
-    ipv6_pattern = r"^([0-9a-fA-F]{0,4}:){2,7}[0-9a-fA-F]{0,4}$"
-    return re.match(ipv4_pattern, ip) is not None or re.match(ipv6_pattern, ip) is not None
+    return IPV4_PATTERN.match(ip) is not None or IPV6_PATTERN.match(ip) is not None
 
 # 从 host 节点提取 IP（优先 ipv4）
 def get_ip_from_host(host) -> str:
@@ -209,215 +238,1419 @@ def get_ip_from_host(host) -> str:
     return ip or ""
 
 # ===========================
-# 合并所有 Nmap XML 文件
+# 内部行模型：整数端口、独立协议列、驻留字符串、打包 IP
+# 展示用的 "端口/协议" 等列只在输出阶段生成
 # ===========================
-def merge_all_xml(output_file="out.xml"):
-    xml_files = [f for f in os.listdir(".") if f.lower().endswith(".xml")]
-    if not xml_files:
-        logger.warning("没有找到 XML 文件，跳过合并。")
-        return None
+# 输出阶段的展示列
+ROW_COLUMNS = ["IP", "端口/协议", "状态", "服务", "端口用途"]
+# 内部列（DataFrame 阶段）
+RECORD_COLUMNS = ["IP", "端口", "协议", "状态", "服务", "端口用途"]
+# 端口不是规范整数（如 "0021"、"80-90"）时保留原文的附加列
+PORT_TEXT_COLUMN = "端口原文"
+NO_PORT = -1
+_PORT_INT = re.compile(r"^(0|[1-9][0-9]{0,8})$")
 
-    logger.info(f"开始合并 {len(xml_files)} 个 XML 文件 -> {output_file}")
+@lru_cache(maxsize=65536)
+def pack_ip(text):
+    """IP 文本 -> 打包字节（IPv4 4 字节 / IPv6 16 字节）；非法或非规范写法的文本原样保留，保证可无损还原"""
     try:
-        main_tree = ET.parse(xml_files[0])
-        main_root = main_tree.getroot()
-    except Exception as e:
-        logger.error(f"解析第一个 XML ({xml_files[0]}) 失败: {e}")
-        return None
+        addr = ipaddress.ip_address(text)
+    except ValueError:
+        return text
+    return addr.packed if str(addr) == text else text
+
+@lru_cache(maxsize=65536)
+def unpack_ip(value):
+    if isinstance(value, bytes):
+        return str(ipaddress.ip_address(value))
+    return value
+
+def split_port(text):
+    """端口文本 -> (整数端口, 原文)：规范整数返回 (int, None)，空串返回 (NO_PORT, None)，其余保留原文"""
+    if not text:
+        return NO_PORT, None
+    if _PORT_INT.match(text):
+        return int(text), None
+    return NO_PORT, text
+
+def format_port_proto(port, protocol, port_text=None):
+    """还原展示用的 "端口/协议"：80/tcp、/tcp（缺端口）、空串（端口协议都缺）"""
+    if port != NO_PORT:
+        return f"{port}/{protocol}"
+    if port_text:
+        return f"{port_text}/{protocol}"
+    return f"/{protocol}" if protocol else ""
+
+class PortRecord:
+    """单个端口记录（__slots__，无逐行字典开销）"""
+    __slots__ = ("ip", "port", "protocol", "state", "service", "remark", "port_text", "extra")
+
+    def __init__(self, ip, port=NO_PORT, protocol="", state="", service="", remark="", port_text=None, extra=None):
+        self.ip = ip                  # 打包字节或无法打包的原文
+        self.port = port              # 整数端口，缺失为 NO_PORT
+        self.protocol = protocol
+        self.state = state
+        self.service = service
+        self.remark = remark
+        self.port_text = port_text    # 端口不是规范整数时的原文
+        self.extra = extra            # --fields 额外字段的取值元组（未指定时为 None）
+
+    @property
+    def ip_text(self):
+        return unpack_ip(self.ip)
+
+    def to_row(self):
+        """展示格式的行字典"""
+        return {
+            "IP": self.ip_text,
+            "端口/协议": format_port_proto(self.port, self.protocol, self.port_text),
+            "状态": self.state,
+            "服务": self.service,
+            "端口用途": self.remark,
+        }
+
+class RecordColumns:
+    """
+    列式缓冲：端口为 array('i')，其余为驻留字符串（或打包 IP）的列表，
+    非规范端口原文稀疏存放在 {行号: 原文}。既用于累积解析结果，也是跨进程/缓存传输的批次格式。
+    --fields 的额外字段存放在 extra {列名: 取值列表}；拼接缺少某列的批次时该列补空串。
+    """
+    def __init__(self, extra_columns=()):
+        self.ip = []
+        self.port = array("i")
+        self.protocol = []
+        self.state = []
+        self.service = []
+        self.remark = []
+        self.port_text = {}
+        self.extra = {name: [] for name in extra_columns}
+
+    def __len__(self):
+        return len(self.port)
+
+    def clear(self):
+        """释放所有列（已转成 DataFrame 等之后调用，尽早归还内存）"""
+        self.__init__(self.extra)
+
+    def append(self, rec):
+        if rec.port_text is not None:
+            self.port_text[len(self.port)] = rec.port_text
+        self.ip.append(rec.ip)
+        self.port.append(rec.port)
+        self.protocol.append(rec.protocol)
+        self.state.append(rec.state)
+        self.service.append(rec.service)
+        self.remark.append(rec.remark)
+        if self.extra:
+            for values, value in zip(self.extra.values(), rec.extra or ()):
+                values.append(value)
+
+    @classmethod
+    def from_records(cls, records, extra_columns=()):
+        batch = cls(extra_columns)
+        append = batch.append
+        for rec in records:
+            append(rec)
+        return batch
 
-    for xml_file in xml_files[1:]:
+    def extend(self, other):
+        offset = len(self.port)
+        for i, text in other.port_text.items():
+            self.port_text[offset + i] = text
+        self.ip.extend(other.ip)
+        self.port.extend(other.port)
+        self.protocol.extend(other.protocol)
+        self.state.extend(other.state)
+        self.service.extend(other.service)
+        self.remark.extend(other.remark)
+        if self.extra or other.extra:
+            for name, values in other.extra.items():
+                self.extra.setdefault(name, [""] * offset).extend(values)
+            for values in self.extra.values():
+                values.extend([""] * (len(self.port) - len(values)))
+
+    def record(self, i):
+        extra = tuple(values[i] for values in self.extra.values()) if self.extra else None
+        return PortRecord(self.ip[i], self.port[i], self.protocol[i], self.state[i],
+                          self.service[i], self.remark[i], self.port_text.get(i), extra)
+
+    def records(self):
+        for i in range(len(self.port)):
+            yield self.record(i)
+
+    def take(self, indices):
+        batch = RecordColumns()
+        if self.extra:
+            indices = list(indices)
+            batch.extra = {name: [values[i] for i in indices] for name, values in self.extra.items()}
+        for new_i, i in enumerate(indices):
+            if i in self.port_text:
+                batch.port_text[new_i] = self.port_text[i]
+            batch.ip.append(self.ip[i])
+            batch.port.append(self.port[i])
+            batch.protocol.append(self.protocol[i])
+            batch.state.append(self.state[i])
+            batch.service.append(self.service[i])
+            batch.remark.append(self.remark[i])
+        return batch
+
+    def to_dict(self):
+        """可 JSON 序列化的形式（IP 还原为文本），用于解析缓存"""
+        return {
+            "ip": [unpack_ip(v) for v in self.ip],
+            "port": self.port.tolist(),
+            "protocol": self.protocol,
+            "state": self.state,
+            "service": self.service,
+            "remark": self.remark,
+            "port_text": {str(i): t for i, t in self.port_text.items()},
+            "extra": self.extra,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        batch = cls()
+        batch.ip = [pack_ip(v) for v in data["ip"]]
+        batch.port = array("i", data["port"])
+        for name in ("protocol", "state", "service", "remark"):
+            setattr(batch, name, [sys.intern(v) for v in data[name]])
+        batch.port_text = {int(i): t for i, t in data["port_text"].items()}
+        batch.extra = data.get("extra", {})
+        return batch
+
+    @classmethod
+    def from_frame(cls, df):
+        """由内部列 DataFrame（见 RECORD_COLUMNS）构建批次，IP 按唯一值打包"""
+        batch = cls()
+        codes, uniques = pd.factorize(df["IP"].astype(object).where(df["IP"].notna(), ""))
+        packed = [pack_ip(v) for v in uniques]
+        batch.ip = [packed[c] for c in codes]
+        batch.port = array("i", df["端口"].fillna(NO_PORT).astype("int64").tolist())
+        for name, col in (("protocol", "协议"), ("state", "状态"), ("service", "服务"), ("remark", "端口用途")):
+            batch_col = df[col].astype(object).where(df[col].notna(), "")
+            setattr(batch, name, [sys.intern(str(v)) for v in batch_col])
+        if PORT_TEXT_COLUMN in df.columns:
+            texts = df[PORT_TEXT_COLUMN].reset_index(drop=True)
+            batch.port_text = {int(i): t for i, t in texts[texts.notna() & (texts != "")].items()}
+        return batch
+
+    def to_frame(self):
+        """转为内部列 DataFrame：IP 解包为文本，端口 Int32（缺失为 NA），协议/状态/服务为类别型"""
+        codes, uniques = pd.factorize(pd.Series(self.ip, dtype=object))
+        ip_text = np.array([unpack_ip(v) for v in uniques] + [""], dtype=object)
+        values = np.frombuffer(self.port, dtype=np.intc).astype(np.int32) if len(self.port) else np.empty(0, np.int32)
+        port = pd.arrays.IntegerArray(values, values == NO_PORT)
+        df = pd.DataFrame({
+            "IP": ip_text[codes],
+            "端口": port,
+            "协议": pd.Categorical(self.protocol),
+            "状态": pd.Categorical(self.state),
+            "服务": pd.Categorical(self.service),
+            "端口用途": pd.Series(self.remark, dtype=object),
+        })
+        for name, values in self.extra.items():
+            df[name] = pd.Series(values, dtype=object)
+        if self.port_text:
+            texts = np.full(len(self.port), None, dtype=object)
+            for i, t in self.port_text.items():
+                texts[i] = t
+            df[PORT_TEXT_COLUMN] = texts
+        return df
+
+def to_display_frame(df):
+    """内部列 -> 展示列（IP, 端口/协议, 状态, 服务, 端口用途, 其余附加列按原顺序）"""
+    if "端口/协议" in df.columns:
+        return df
+    protocol = df["协议"].astype(object).where(df["协议"].notna(), "").astype(str)
+    port = df["端口"]
+    port_proto = pd.Series(np.where(protocol != "", "/" + protocol, ""), index=df.index, dtype=object)
+    if PORT_TEXT_COLUMN in df.columns:
+        texts = df[PORT_TEXT_COLUMN]
+        has_text = texts.notna() & (texts != "") & port.isna()
+        port_proto[has_text] = texts[has_text].astype(str) + "/" + protocol[has_text]
+    has_port = port.notna()
+    port_proto[has_port] = port[has_port].astype("int64").astype(str) + "/" + protocol[has_port]
+    out = pd.DataFrame({"IP": df["IP"], "端口/协议": port_proto}, index=df.index)
+    for col in ("状态", "服务", "端口用途"):
+        out[col] = df[col]
+    for col in df.columns:
+        if col not in RECORD_COLUMNS and col != PORT_TEXT_COLUMN:
+            out[col] = df[col]
+    return out
+
+# ===========================
+# 合并所有 Nmap XML 文件
+# ===========================
+def find_xml_files(directory=".", exclude=()):
+    """列出目录下的 Nmap XML（按文件名排序），排除 exclude 中的文件（如上次遗留的合并结果）"""
+    excluded = {os.path.abspath(p) for p in exclude if p}
+    xml_files = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name) if directory != "." else name
+        if not name.lower().endswith(".xml") or not os.path.isfile(path):
+            continue
+        if os.path.abspath(path) in excluded:
+            logger.debug(f"跳过 XML 文件: {path}")
+            continue
+        xml_files.append(path)
+    return xml_files
+
+class MergedXmlWriter:
+    """
+    流式写出合并后的 Nmap XML：根节点沿用第一个文件的 <nmaprun> 属性，
+    第一个文件的其它顶层节点（scaninfo/runstats 等）原样保留，所有文件的 <host> 依次追加。
+    先写临时文件，close() 时再原子替换目标文件。
+    """
+    def __init__(self, output_file):
+        self.output_file = output_file
+        out_dir = os.path.dirname(os.path.abspath(output_file))
+        tmp_fd, self.tmp_path = tempfile.mkstemp(suffix=".xml", dir=out_dir)
+        self._fh = os.fdopen(tmp_fd, "w", encoding="utf-8")
+        self._fh.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        self._root_tag = None
+        self._source = None
+        self._first_source = None
+        self.hosts = 0
+
+    def write(self, elem, root, source):
+        """iter_nmap_xml 的 on_node 回调：elem 为已闭合的 host 或根节点下的直接子节点"""
+        if self._root_tag is None and root is not None:
+            self._root_tag = root.tag
+            self._first_source = source
+            from xml.sax.saxutils import quoteattr
+            attrs = "".join(f" {k}={quoteattr(v)}" for k, v in root.attrib.items())
+            self._fh.write(f"<{root.tag}{attrs}>\n")
+        if self._root_tag is None:
+            return
+        if elem.tag == "host":
+            self.hosts += 1
+        elif source != self._first_source:
+            return
+        self._fh.write(ET.tostring(elem, encoding="unicode"))
+
+    def close(self):
         try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-            # 找到所有 host 节点并追加
-            for host in root.findall(".//host"):
-                main_root.append(host)
+            if self._root_tag is not None:
+                self._fh.write(f"</{self._root_tag}>\n")
+            self._fh.close()
+            shutil.move(self.tmp_path, self.output_file)
+            logger.info(f"XML 合并完成（{self.hosts} 个 host），结果保存为 {self.output_file}")
+            return self.output_file
         except Exception as e:
-            logger.error(f"合并文件 {xml_file} 出错: {e}")
+            logger.error(f"保存合并 XML 失败: {e}")
+            self.abort()
+            return None
 
-    try:
-        main_tree.write(output_file, encoding="utf-8", xml_declaration=True)
-        logger.info(f"XML 合并完成，结果保存为 {output_file}")
-        return output_file
-    except Exception as e:
-        logger.error(f"保存合并 XML 失败: {e}")
+    def abort(self):
+        if not self._fh.closed:
+            self._fh.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def merge_all_xml(output_file="out.xml", xml_files=None):
+    if xml_files is None:
+        xml_files = find_xml_files(".", exclude=[output_file])
+    if not xml_files:
+        logger.warning("没有找到 XML 文件，跳过合并。")
         return None
 
+    logger.info(f"开始合并 {len(xml_files)} 个 XML 文件 -> {output_file}")
+    writer = MergedXmlWriter(output_file)
+    for xml_file in xml_files:
+        # 只需要回调写出 host，行数据直接丢弃
+        for _ in iter_nmap_xml(xml_file, progress=False, on_node=writer.write):
+            pass
+    return writer.close()
+
 # ===========================
 # 解析 Nmap XML
 # ===========================
-def parse_nmap_xml(xml_file):
-    results = []
+# --fields 可选字段 -> 报表列名；脚本字段写作 script:<ID>，列名为 "脚本:<ID>"
+FIELD_COLUMNS = {
+    "product": "产品",
+    "version": "版本",
+    "extrainfo": "附加信息",
+    "hostname": "主机名",
+    "os": "操作系统",
+}
+# 默认就会输出的字段，写在 --fields 里也不额外增加列
+CORE_FIELDS = {"ip", "port", "protocol", "state", "service", "remark"}
+SCRIPT_FIELD_PREFIX = "script:"
+# Excel 单元格最多 32767 个字符，脚本输出超出部分截断
+MAX_FIELD_CHARS = 32767
+
+class FieldProjection:
+    """
+    --fields 字段投影：只访问被请求字段所在的子树。
+    未请求脚本时不会遍历任何 <script>，未请求主机名/操作系统时不会查找 <hostnames>/<os>。
+    端口级脚本优先，其次取同名的 hostscript。
+    """
+    def __init__(self, spec):
+        self.fields = []
+        for field in (f.strip() for f in spec.split(",")):
+            if not field or field in CORE_FIELDS or field in self.fields:
+                continue
+            if field not in FIELD_COLUMNS and not (field.startswith(SCRIPT_FIELD_PREFIX) and len(field) > len(SCRIPT_FIELD_PREFIX)):
+                raise ValueError(f"未知字段: {field}（可选 {', '.join(sorted(CORE_FIELDS | set(FIELD_COLUMNS)))}、script:<ID>）")
+            self.fields.append(field)
+        self.columns = [FIELD_COLUMNS.get(f) or "脚本:" + f[len(SCRIPT_FIELD_PREFIX):] for f in self.fields]
+        # 参与解析缓存的键：字段不同，缓存的批次也不同
+        self.variant = ",".join(self.fields)
+        index = {f: i for i, f in enumerate(self.fields)}
+        self._service_attrs = [(index[f], f) for f in ("product", "version", "extrainfo") if f in index]
+        self._scripts = {f[len(SCRIPT_FIELD_PREFIX):]: i for f, i in index.items() if f.startswith(SCRIPT_FIELD_PREFIX)}
+        self._hostname = index.get("hostname")
+        self._os = index.get("os")
+
+    def __bool__(self):
+        return bool(self.fields)
+
+    def _script_output(self, script):
+        return sys.intern((script.get("output") or "").strip()[:MAX_FIELD_CHARS])
+
+    def host_values(self, host):
+        """主机级字段（主机名、操作系统、hostscript），同一 host 的端口共享"""
+        values = [""] * len(self.fields)
+        if self._hostname is not None:
+            names = [h.get("name") for h in host.iterfind("hostnames/hostname") if h.get("name")]
+            values[self._hostname] = sys.intern(", ".join(dict.fromkeys(names)))
+        if self._os is not None:
+            match = host.find("os/osmatch")
+            if match is not None and match.get("name"):
+                accuracy = match.get("accuracy")
+                values[self._os] = sys.intern(f"{match.get('name')} ({accuracy}%)" if accuracy else match.get("name"))
+        if self._scripts:
+            for script in host.iterfind("hostscript/script"):
+                i = self._scripts.get(script.get("id"))
+                if i is not None:
+                    values[i] = self._script_output(script)
+        return values
+
+    def port_values(self, port, service_elem, host_values):
+        values = list(host_values)
+        if service_elem is not None:
+            for i, attr in self._service_attrs:
+                values[i] = sys.intern(service_elem.get(attr) or "")
+        if self._scripts:
+            for script in port.iterfind("script"):
+                i = self._scripts.get(script.get("id"))
+                if i is not None:
+                    values[i] = self._script_output(script)
+        return tuple(values)
+
+def host_to_records(host, xml_file="", h_index=0, fields=None):
+    """
+    把单个 <host> 节点转换为 PortRecord 列表（每个 <port> 一条）。
+    fields 为 FieldProjection 时附带额外字段；只遍历 <ports> 的直接子节点，不深入脚本输出。
+    """
+    ip = get_ip_from_host(host)
+    if not is_valid_ip(ip):
+        logger.debug(f"[Nmap] 文件 {xml_file} Host#{h_index} IP 无效或缺失: {ip}")
+    # 同一 host 的所有端口共享同一个打包 IP 对象
+    packed_ip = pack_ip(ip)
+    host_values = fields.host_values(host) if fields else None
+
+    records = []
+    intern = sys.intern
+    # port 元素在 host/ports/port 下；非标准结构时退回全树查找
+    ports = host.find("ports")
+    for port in (ports.iterfind("port") if ports is not None else host.iter("port")):
+        proto = port.get("protocol") or ""
+        portid, port_text = split_port(port.get("portid") or "")
+        # state
+        state_elem = port.find("state")
+        state = state_elem.get("state") if state_elem is not None and state_elem.get("state") else ""
+        # service
+        service_elem = port.find("service")
+        service = service_elem.get("name") if service_elem is not None and service_elem.get("name") else ""
+        extra = fields.port_values(port, service_elem, host_values) if host_values is not None else None
+        records.append(PortRecord(packed_ip, portid, intern(proto), intern(state), intern(service), "", port_text, extra))
+    return records
+
+def iter_host_records(events, xml_file="", on_node=None, bar=None, fields=None):
+    """
+    消费 (event, elem) 事件流（iterparse 或 XMLPullParser.read_events 均可），
+    每当一个 <host> 闭合就产出其端口记录，随后把节点从父节点上摘除释放。
+    fields 为 FieldProjection（--fields）时记录附带额外字段。
+    """
+    # 记录当前打开的节点链，用于把处理完的节点从父节点上摘除
+    stack = []
+    h_index = 0
+    for event, elem in events:
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == "host":
+            yield from host_to_records(elem, xml_file, h_index, fields)
+            h_index += 1
+            if bar is not None:
+                bar.update(1)
+        elif len(stack) != 1:
+            continue
+        if on_node is not None:
+            on_node(elem, stack[0] if stack else None, xml_file)
+        # host 或根节点下的其它直接子节点处理完即释放
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+def iter_nmap_xml(xml_file, progress=True, on_node=None, fields=None):
+    """
+    流式解析 Nmap XML：每当一个 <host> 闭合就产出其端口记录（PortRecord），随后释放该节点，
+    内存占用与文件大小无关（只与单个 host 的大小有关）。
+    on_node(elem, root, xml_file) 在 host 或根节点的直接子节点闭合、释放之前被调用
+    （用于边解析边写出合并 XML）。
+    文件末尾不完整（扫描未结束）时保留已闭合的 host。
+    """
     if not os.path.exists(xml_file):
         logger.warning(f"文件不存在: {xml_file}")
-        return results
+        return
+    from tqdm import tqdm
+    bar = tqdm(desc=f"解析Nmap: {xml_file}", unit="host", disable=not progress)
     try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        hosts = root.findall(".//host")
-        for h_index, host in enumerate(tqdm(hosts, desc=f"解析Nmap: {xml_file}", unit="host")):
-            ip = get_ip_from_host(host)
-            if not is_valid_ip(ip):
-                logger.debug(f"[Nmap] 文件 {xml_file} Host#{h_index} IP 无效或缺失: {ip}")
-
-            # port 元素可能在 host/ports/port 下
-            for port in host.findall(".//port"):
-                proto = port.get("protocol") or ""
-                portid = port.get("portid") or ""
-                # state
-                state_elem = port.find("state")
-                state = state_elem.get("state") if state_elem is not None and state_elem.get("state") else ""
-                # service
-                service_elem = port.find("service")
-                service = service_elem.get("name") if service_elem is not None and service_elem.get("name") else ""
-                results.append({
-                    "IP": ip,
-                    "端口/协议": f"{portid}/{proto}" if portid else f"/{proto}",
-                    "状态": state,
-                    "服务": service,
-                    "端口用途": "",
-                })
+        yield from iter_host_records(ET.iterparse(xml_file, events=("start", "end")), xml_file, on_node, bar, fields)
+    except ET.ParseError as e:
+        logger.warning(f"Nmap 文件 {xml_file} 不完整或格式错误（{e}），已保留此前闭合的 host")
     except Exception as e:
         logger.error(f"解析 Nmap 文件 {xml_file} 出错: {e}")
-    return results
+    finally:
+        bar.close()
+
+def parse_nmap_xml(xml_file):
+    """返回展示格式的行字典列表"""
+    return [rec.to_row() for rec in iter_nmap_xml(xml_file)]
 
 # ===========================
-# 解析 Excel/CSV 表格（增加编码回退和列名模糊匹配）
+# 解析 Excel/CSV 表格（编码探测、分块读取和列名模糊匹配）
 # ===========================
-def parse_table(file_path):
-    results = []
+# 列映射（保留原逻辑，但做小写匹配与模糊匹配）
+TABLE_COL_MAP = {
+    "IP": ["ip","地址","host"],
+    "端口/协议": ["端口/协议","端口","port"],
+    "状态": ["状态","state","开放状态"],
+    "服务": ["服务","service","协议"],
+    "端口用途": ["端口用途","用途","备注","remark"]
+}
+
+def resolve_table_columns(columns):
+    """按 TABLE_COL_MAP 把表格的实际列名映射到标准列名，找不到的为 None"""
+    cols_lower = {c.lower(): c for c in columns}
+    real_cols = {}
+    for std_col, aliases in TABLE_COL_MAP.items():
+        found = None
+        for alias in aliases:
+            if alias in columns:
+                found = alias
+                break
+            if alias.lower() in cols_lower:
+                found = cols_lower[alias.lower()]
+                break
+        # 如果还没找到，尝试模糊匹配（包含关键字）
+        if not found:
+            for actual in columns:
+                al = actual.lower()
+                for alias in aliases:
+                    if alias in al or alias.lower() in al:
+                        found = actual
+                        break
+                if found:
+                    break
+        real_cols[std_col] = found
+    return real_cols
+
+def _text_column(df, col):
+    """取出一列并整列转为去首尾空白的字符串，缺失值（NaN）转为空串"""
+    if not col:
+        return pd.Series("", index=df.index, dtype=object)
+    s = df[col]
+    # 整数端口在含空值的列里会被读成 float（22.0），先转回可空整数
+    if pd.api.types.is_float_dtype(s) and (s.dropna() % 1 == 0).all():
+        s = s.astype("Int64")
+    return s.astype(object).where(s.notna(), "").astype(str).str.strip().astype(object)
+
+# 本工具 parquet/feather 输出中 协议 列的取值（传输层协议）
+TRANSPORT_PROTOCOLS = {"tcp", "udp", "sctp", ""}
+
+def is_columnar_layout(df):
+    """
+    是否为本工具 parquet/feather 输出的 端口、协议 分列布局：端口为整数列且协议只含传输层协议。
+    普通资产表里的 "协议" 常是服务名的别名（HTTP、DNS），不能拼成 端口/协议。
+    """
+    if "端口/协议" in df.columns or not {"端口", "协议", "服务"} <= set(df.columns):
+        return False
+    if not pd.api.types.is_integer_dtype(df["端口"]):
+        return False
+    protocols = pd.unique(df["协议"].dropna().astype(str))
+    return {p.strip().lower() for p in protocols} <= TRANSPORT_PROTOCOLS
+
+def normalize_table(df, file_path="", keep_columns=()):
+    """
+    按列向量化归一化表格，返回内部列（RECORD_COLUMNS，必要时附加 端口原文）的 DataFrame。
+    keep_columns 中存在于原表的列按文本原样附加（如读取基线时的“变化”列）。
+    """
+    real_cols = resolve_table_columns(df.columns)
+    text = {c: _text_column(df, real_cols[c]) for c in ROW_COLUMNS}
+    if is_columnar_layout(df):
+        # 本工具 parquet/feather 输出的 端口、协议 分列布局（此时 "协议" 不是服务名的别名）
+        port = _text_column(df, "端口")
+        protocol = _text_column(df, "协议")
+        joined = port.where(protocol == "", port + "/" + protocol)
+        if PORT_TEXT_COLUMN in df.columns:
+            port_text = _text_column(df, PORT_TEXT_COLUMN)
+            joined = joined.where(port_text == "", port_text + "/" + protocol)
+        text["端口/协议"] = joined
+
+    # 端口/协议 拆成整数端口与协议；没有 "/" 的默认协议为 tcp
+    port_proto = text["端口/协议"]
+    parts = port_proto.str.partition("/")
+    port_part = parts[0]
+    default_proto = pd.Series(np.where(port_proto != "", "tcp", ""), index=df.index, dtype=object)
+    protocol = parts[2].where(parts[1] != "", default_proto)
+    is_int = port_part.str.match(_PORT_INT.pattern)
+    port = pd.to_numeric(port_part.where(is_int), errors="coerce").astype("Int32")
+
+    out = pd.DataFrame({
+        "IP": text["IP"],
+        "端口": port,
+        "协议": protocol,
+        "状态": text["状态"],
+        "服务": text["服务"],
+        "端口用途": text["端口用途"],
+    }, index=df.index)
+    odd_port = ~is_int & (port_part != "")
+    if odd_port.any():
+        out[PORT_TEXT_COLUMN] = port_part.where(odd_port, None)
+    for col in keep_columns:
+        if col in df.columns:
+            out[col] = _text_column(df, col)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        ip = out["IP"]
+        invalid = (ip != "") & ~(ip.str.match(IPV4_PATTERN.pattern) | ip.str.match(IPV6_PATTERN.pattern))
+        for i, bad_ip in ip[invalid].items():
+            logger.debug(f"[表格] 文件 {file_path} 行 {i+2} IP 看起来无效: {bad_ip}")
+    return out.reset_index(drop=True)
+
+# 表格分块读取的行数；内存占用只与块大小有关，与文件大小无关
+TABLE_CHUNK_ROWS = 100000
+# 判断 CSV 编码时读取的样本字节数
+ENCODING_SAMPLE_BYTES = 1 << 20
+
+def sniff_encoding(file_path, sample_size=ENCODING_SAMPLE_BYTES):
+    """按文件头部样本判断 CSV 编码：有 BOM 按 BOM，样本能按 UTF-8 解码即 UTF-8，否则按 GB18030（GBK 的超集）"""
+    with open(file_path, "rb") as f:
+        sample = f.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # 样本可能截断在多字节字符中间，未读完整个文件时不要求末尾完整
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < sample_size)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+def excel_header(values):
+    """表头单元格 -> 列名：空单元格为 Unnamed: i，重名依次追加 .1、.2（与 pd.read_excel 相同）"""
+    columns = []
+    seen = {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        columns.append(name)
+    return columns
+
+def iter_excel_frames(file_path, chunksize=TABLE_CHUNK_ROWS):
+    """
+    以只读模式逐行读取 xlsx，每 chunksize 行产出一个 DataFrame（行号连续）。
+    若是本工具拆分过的报表（含“索引”表），依次读取各分表，否则只读第一张表；整行为空的行跳过。
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheets = wb.worksheets
+        if INDEX_SHEET_TITLE in wb.sheetnames:
+            sheets = [ws for ws in sheets if ws.title != INDEX_SHEET_TITLE]
+        else:
+            sheets = sheets[:1]
+        start = 0
+        for ws in sheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = excel_header(header)
+            width = len(columns)
+            chunk = []
+            for row in rows:
+                if row.count(None) == len(row):
+                    continue
+                if len(row) != width:
+                    row = (row + (None,) * width)[:width]
+                chunk.append(row)
+                if len(chunk) >= chunksize:
+                    yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+                    start += len(chunk)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+                start += len(chunk)
+    finally:
+        wb.close()
+
+def iter_table_frames(file_path, chunksize=TABLE_CHUNK_ROWS):
+    """按扩展名分块读取原始表格（未归一化）；parquet/feather 本身是紧凑的列式格式，整体读取"""
+    lower = file_path.lower()
+    if lower.endswith(".xlsx") or lower.endswith(".xls"):
+        yield from iter_excel_frames(file_path, chunksize)
+    elif lower.endswith(".parquet"):
+        yield pd.read_parquet(file_path)
+    elif lower.endswith(".feather"):
+        yield pd.read_feather(file_path)
+    elif lower.endswith(".jsonl"):
+        with pd.read_json(file_path, lines=True, dtype=False, chunksize=chunksize) as reader:
+            yield from reader
+    else:
+        encoding = sniff_encoding(file_path)
+        logger.debug(f"[表格] 文件 {file_path} 编码: {encoding}")
+        # 全部按文本读取：各块的列类型一致，端口、备注等保留原样；样本之后的个别坏字节替换而不是整体失败
+        with pd.read_csv(file_path, encoding=encoding, encoding_errors="replace", dtype=str,
+                         chunksize=chunksize) as reader:
+            yield from reader
+
+def iter_table_chunks(file_path, chunksize=TABLE_CHUNK_ROWS, keep_columns=()):
+    """
+    分块读取并逐块归一化表格，产出内部列（RECORD_COLUMNS）DataFrame。
+    读取中途出错时保留此前已读取的块。
+    """
+    rows = 0
+    try:
+        for frame in iter_table_frames(file_path, chunksize):
+            if len(frame):
+                rows += len(frame)
+                yield normalize_table(frame, file_path, keep_columns)
+    except Exception as e:
+        kept = f"，已保留此前读取的 {rows} 行" if rows else ""
+        logger.error(f"解析文件 {file_path} 出错: {e}{kept}")
+        return
+    if rows:
+        logger.info(f"解析表格: {file_path}（{rows} 行）")
+    else:
+        logger.warning(f"文件为空: {file_path}")
+
+def parse_table(file_path, keep_columns=()):
+    """读取整个表格为内部列 DataFrame（逐块归一化后拼接，不保留原始表格）"""
+    empty = pd.DataFrame(columns=RECORD_COLUMNS)
     if not os.path.exists(file_path):
         logger.error(f"文件不存在: {file_path}")
-        return results
+        return empty
+    chunks = list(iter_table_chunks(file_path, keep_columns=keep_columns))
+    if not chunks:
+        return empty
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+# ===========================
+# 多文件解析（可选进程池），结果以列式批次返回
+# ===========================
+def parse_source(source, progress=True, on_node=None, fields=None):
+    """
+    解析单个输入源 (kind, path)，kind 为 "xml" 或 "table"，返回列式批次（RecordColumns）。
+    fields（FieldProjection）只作用于 XML，表格没有这些字段，合并时补空。
+    """
+    kind, path = source
+    if kind == "xml":
+        return RecordColumns.from_records(iter_nmap_xml(path, progress=progress, on_node=on_node, fields=fields),
+                                          fields.columns if fields else ())
+    if not os.path.exists(path):
+        # 不存在的表格（如默认的 开放端口.xlsx）不需要为此导入 pandas
+        logger.error(f"文件不存在: {path}")
+        return RecordColumns()
+    # 逐块归一化后追加到紧凑的列式批次，原始表格不会整体留在内存中
+    batch = RecordColumns()
+    for frame in iter_table_chunks(path):
+        batch.extend(RecordColumns.from_frame(frame))
+    return batch
+
+def _init_worker(verbose):
+    global logger
+    logger = make_logger(verbose)
+
+def _parse_source_worker(source, fields=None):
+    return parse_source(source, progress=False, fields=fields)
+
+# ===========================
+# 解析结果缓存（SQLite，按 路径+大小+mtime+内容哈希 命中）
+# ===========================
+CACHE_VERSION = "2"
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def same_stat(a, b):
+    """大小与 mtime 都一致视为文件未变"""
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+class ParseCache:
+    """
+    每个输入文件的解析结果（列式批次）存放在 SQLite 中。
+    大小与 mtime 都未变时只需一次 stat 即可命中；mtime 变了但大小相同则比对内容哈希，
+    哈希一致（如仅被 touch）时刷新 mtime 并继续使用缓存。
+    """
+    def __init__(self, db_path, variant=CACHE_VERSION):
+        self.db_path = db_path
+        self.variant = variant
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parsed ("
+            " path TEXT NOT NULL, kind TEXT NOT NULL, size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL, variant TEXT NOT NULL,"
+            " data BLOB NOT NULL, PRIMARY KEY (path, kind))"
+        )
+
+    @staticmethod
+    def _key(source):
+        kind, path = source
+        return kind, os.path.abspath(path)
+
+    def get(self, source):
+        kind, path = self._key(source)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, sha256, variant, data FROM parsed WHERE path = ? AND kind = ?",
+            (path, kind)).fetchone()
+        if row is None or row[3] != self.variant or row[0] != st.st_size:
+            self.misses += 1
+            return None
+        if row[1] != st.st_mtime_ns:
+            if file_digest(path) != row[2]:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE parsed SET mtime_ns = ? WHERE path = ? AND kind = ?",
+                               (st.st_mtime_ns, path, kind))
+        self.hits += 1
+        return RecordColumns.from_dict(json.loads(zlib.decompress(row[4]).decode("utf-8")))
+
+    def stat(self, source):
+        """解析前先取 stat，避免解析期间文件被改写却以新 mtime 入库"""
+        try:
+            return os.stat(self._key(source)[1])
+        except OSError:
+            return None
+
+    def put(self, source, columns, st):
+        """
+        st 为解析前的 stat。哈希是解析后才算的，所以哈希前后都要确认文件与解析前一致，
+        否则解析期间被改写（即便大小不变）的文件会把旧结果存到新内容的哈希下。
+        """
+        if st is None:
+            return
+        kind, path = self._key(source)
+        try:
+            if not same_stat(os.stat(path), st):
+                return
+            digest = file_digest(path)
+            if not same_stat(os.stat(path), st):
+                return
+        except OSError:
+            return
+        data = zlib.compress(json.dumps(columns.to_dict(), ensure_ascii=False).encode("utf-8"))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO parsed (path, kind, size, mtime_ns, sha256, variant, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, kind, st.st_size, st.st_mtime_ns, digest, self.variant, sqlite3.Binary(data)))
+
+    def prune(self):
+        """删除源文件已不存在的缓存条目"""
+        stale = [(p, k) for p, k in self._conn.execute("SELECT path, kind FROM parsed")
+                 if not os.path.exists(p)]
+        self._conn.executemany("DELETE FROM parsed WHERE path = ? AND kind = ?", stale)
+        return len(stale)
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+def iter_parsed_sources(sources, jobs=1, verbose=False, on_node=None, cache=None, fields=None):
+    """
+    按输入顺序逐个产出 (source, 列式批次)。命中 cache 的文件不再解析；
+    其余文件在 jobs > 1 时使用进程池并行解析，Executor.map 保证结果顺序与输入一致，
+    不受 worker 完成先后影响。on_node 只在串行模式下生效（见 iter_nmap_xml）。
+    """
+    sources = list(sources)
+    cached = {}
+    if cache is not None:
+        for i, source in enumerate(sources):
+            columns = cache.get(source)
+            if columns is not None:
+                cached[i] = columns
+        logger.info(f"解析缓存命中 {len(cached)}/{len(sources)} 个文件")
+    pending = [s for i, s in enumerate(sources) if i not in cached]
+    stats = [cache.stat(s) for s in pending] if cache is not None else [None] * len(pending)
+
+    pool = None
+    if jobs <= 1 or len(pending) <= 1:
+        parsed = (parse_source(s, on_node=on_node, fields=fields) for s in pending)
+    else:
+        workers = min(jobs, len(pending))
+        logger.info(f"使用 {workers} 个进程并行解析 {len(pending)} 个文件")
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(verbose,))
+        from tqdm import tqdm
+        parsed = iter(tqdm(pool.map(partial(_parse_source_worker, fields=fields), pending, chunksize=1),
+                           total=len(pending), desc="并行解析", unit="文件"))
     try:
-        # 自动尝试编码
-        if file_path.lower().endswith(".xlsx") or file_path.lower().endswith(".xls"):
-            df = pd.read_excel(file_path, engine="openpyxl")
-        else:
+        pending_stats = iter(stats)
+        for i, source in enumerate(sources):
+            if i in cached:
+                yield source, cached[i]
+                continue
+            columns = next(parsed)
+            if cache is not None:
+                cache.put(source, columns, next(pending_stats))
+            yield source, columns
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+# ===========================
+# 范围过滤（CIDR / 区间 / 单个 IP 编译为有序区间索引）
+# ===========================
+SCOPE_COLUMN = "范围"
+IN_SCOPE_LABEL = "范围内"
+OUT_OF_SCOPE_LABEL = "范围外"
+
+@lru_cache(maxsize=65536)
+def ip_to_int(value):
+    """打包字节或 IP 文本 -> (版本, 整数)；不是合法 IP 返回 None"""
+    if isinstance(value, bytes):
+        return (4 if len(value) == 4 else 6), int.from_bytes(value, "big")
+    try:
+        addr = ipaddress.ip_address(str(value).strip())
+    except ValueError:
+        return None
+    return addr.version, int(addr)
+
+def parse_scope_entry(entry):
+    """单条范围 -> (版本, 起始整数, 结束整数)：支持 CIDR、a-b 区间、10.0.0.1-50 简写、单个 IP"""
+    if "/" in entry:
+        net = ipaddress.ip_network(entry, strict=False)
+        return net.version, int(net.network_address), int(net.broadcast_address)
+    if "-" in entry:
+        start_text, end_text = (x.strip() for x in entry.split("-", 1))
+        start = ipaddress.ip_address(start_text)
+        if start.version == 4 and end_text.isdigit():
+            # 10.0.0.1-50：只写了末段
+            end_text = start_text.rsplit(".", 1)[0] + "." + end_text
+        end = ipaddress.ip_address(end_text)
+        if start.version != end.version or int(end) < int(start):
+            raise ValueError(f"区间无效: {entry}")
+        return start.version, int(start), int(end)
+    addr = ipaddress.ip_address(entry)
+    return addr.version, int(addr), int(addr)
+
+# 范围文件：先把 "10.0.0.1 - 10.0.0.5" 收拢成一个条目，再按空白/逗号/分号切分
+_SCOPE_RANGE_DASH = re.compile(r"\s*-\s*")
+_SCOPE_SPLIT = re.compile(r"[\s,;]+")
+
+class ScopeIndex:
+    """
+    IPv4/IPv6 各自一组按起点排序、合并后互不重叠的闭区间；单个查找为 O(log n) 二分，
+    批量查找时先对唯一 IP 去重，IPv4 用 numpy.searchsorted 整批完成。
+    """
+    def __init__(self, entries=()):
+        ranges = {4: [], 6: []}
+        for entry in entries:
             try:
-                df = pd.read_csv(file_path, encoding="utf-8")
-            except Exception:
-                df = pd.read_csv(file_path, encoding="gbk", errors="ignore")
-        if df is None or df.empty:
-            logger.warning(f"文件为空: {file_path}")
-            return results
-
-        # 列映射（保留原逻辑，但做小写匹配与模糊匹配）
-        col_map = {
-            "IP": ["ip","地址","host"],
-            "端口/协议": ["端口/协议","端口","port"],
-            "状态": ["状态","state","开放状态"],
-            "服务": ["服务","service","协议"],
-            "端口用途": ["端口用途","用途","备注","remark"]
-        }
-        cols_lower = {c.lower(): c for c in df.columns}
-        real_cols = {}
-        for std_col, aliases in col_map.items():
-            found = None
-            for alias in aliases:
-                if alias in df.columns:
-                    found = alias
-                    break
-                if alias.lower() in cols_lower:
-                    found = cols_lower[alias.lower()]
-                    break
-            # 如果还没找到，尝试模糊匹配（包含关键字）
-            if not found:
-                for actual in df.columns:
-                    al = actual.lower()
-                    for alias in aliases:
-                        if alias in al or alias.lower() in al:
-                            found = actual
-                            break
-                    if found:
-                        break
-            real_cols[std_col] = found
-
-        for i, row in tqdm(df.iterrows(), total=len(df), desc=f"解析表格: {file_path}", unit="行"):
-            raw_ip = row.get(real_cols["IP"], "") if real_cols["IP"] else ""
-            ip = str(raw_ip).strip() if pd.notna(raw_ip) else ""
-            if ip and not is_valid_ip(ip):
-                logger.debug(f"[表格] 文件 {file_path} 行 {i+2} IP 看起来无效: {ip}")
-
-            port_proto = row.get(real_cols["端口/协议"], "") if real_cols["端口/协议"] else ""
-            port_proto = "" if pd.isna(port_proto) else str(port_proto).strip()
-            if port_proto and "/" not in str(port_proto):
-                port_proto = f"{port_proto}/tcp"
-
-            state = row.get(real_cols["状态"], "") if real_cols["状态"] else ""
-            state = "" if pd.isna(state) else str(state).strip()
-            service = row.get(real_cols["服务"], "") if real_cols["服务"] else ""
-            service = "" if pd.isna(service) else str(service).strip()
-            remark = row.get(real_cols["端口用途"], "") if real_cols["端口用途"] else ""
-            remark = "" if pd.isna(remark) else str(remark).strip()
-
-            results.append({
-                "IP": ip,
-                "端口/协议": port_proto,
-                "状态": state,
-                "服务": service,
-                "端口用途": remark,
-            })
-    except Exception as e:
-        logger.error(f"解析文件 {file_path} 出错: {e}")
-    return results
+                version, start, end = parse_scope_entry(entry)
+            except ValueError as e:
+                logger.warning(f"忽略无法识别的范围条目 {entry!r}: {e}")
+                continue
+            ranges[version].append((start, end))
+        self.starts = {}
+        self.ends = {}
+        for version, items in ranges.items():
+            merged = []
+            for start, end in sorted(items):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [r[0] for r in merged]
+            self.ends[version] = [r[1] for r in merged]
+        self._v4_starts = np.array(self.starts[4], dtype=np.uint32)
+        self._v4_ends = np.array(self.ends[4], dtype=np.uint32)
+
+    @classmethod
+    def from_file(cls, path):
+        """每行一个或多个条目（空白/逗号分隔），# 之后为注释；区间的 - 两侧允许有空格"""
+        entries = []
+        with open(path, encoding="utf-8-sig") as fh:
+            for line in fh:
+                line = _SCOPE_RANGE_DASH.sub("-", line.split("#", 1)[0])
+                entries.extend(e for e in _SCOPE_SPLIT.split(line) if e)
+        index = cls(entries)
+        logger.info(f"范围文件 {path}: {len(entries)} 个条目，合并为 "
+                    f"{len(index.starts[4])} 个 IPv4 区间、{len(index.starts[6])} 个 IPv6 区间")
+        return index
+
+    def __len__(self):
+        return len(self.starts[4]) + len(self.starts[6])
+
+    def contains(self, value) -> bool:
+        parsed = ip_to_int(value)
+        if parsed is None:
+            return False
+        version, x = parsed
+        i = bisect_right(self.starts[version], x) - 1
+        return i >= 0 and x <= self.ends[version][i]
+
+    def contains_many(self, values):
+        """values 为打包 IP / IP 文本序列，返回 bool 数组；只对唯一值求值"""
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        hits = np.zeros(len(uniques) + 1, dtype=bool)  # 末位对应缺失值（编码 -1）
+        v4_pos, v4_vals = [], []
+        for pos, value in enumerate(uniques):
+            parsed = ip_to_int(value)
+            if parsed is None:
+                continue
+            if parsed[0] == 4:
+                v4_pos.append(pos)
+                v4_vals.append(parsed[1])
+            else:
+                hits[pos] = self.contains(value)
+        if v4_pos and len(self._v4_starts):
+            x = np.array(v4_vals, dtype=np.uint32)
+            i = np.searchsorted(self._v4_starts, x, side="right") - 1
+            ok = i >= 0
+            ok[ok] = x[ok] <= self._v4_ends[i[ok]]
+            hits[np.array(v4_pos)] = ok
+        return hits[codes]
+
+class ScopeFilter:
+    """--scope（只保留命中的）与 --exclude（剔除命中的）的组合"""
+    def __init__(self, include=None, exclude=None):
+        self.include = include
+        self.exclude = exclude
+        self.dropped = 0
+
+    def keep(self, ip):
+        """单个 IP（打包字节或原文）是否保留；用于逐条到达的记录，范围外的计入 dropped"""
+        ok = ((self.include is None or self.include.contains(ip))
+              and (self.exclude is None or not self.exclude.contains(ip)))
+        if not ok:
+            self.dropped += 1
+        return ok
+
+    def in_scope(self, values):
+        mask = np.ones(len(values), dtype=bool)
+        if self.include is not None:
+            mask &= self.include.contains_many(values)
+        if self.exclude is not None:
+            mask &= ~self.exclude.contains_many(values)
+        return mask
+
+    def filter_batch(self, batch):
+        """丢弃批次中范围外的记录"""
+        if not len(batch):
+            return batch
+        mask = self.in_scope(batch.ip)
+        kept = int(mask.sum())
+        self.dropped += len(batch) - kept
+        if kept == len(batch):
+            return batch
+        return batch.take(np.flatnonzero(mask).tolist())
+
+    def tag(self, df):
+        df[SCOPE_COLUMN] = np.where(self.in_scope(df["IP"]), IN_SCOPE_LABEL, OUT_OF_SCOPE_LABEL).astype(object)
+        return df
 
 # ===========================
-# 标记危险端口/服务（更宽容处理）
+# 标记危险端口/服务（规则引擎：端口区间 + 协议 + 服务模式，编译为查找表）
 # ===========================
-def mark_dangerous(df):
-    def check(row):
-        port = None
+DANGER_LABEL = "危险端口不允许对外开放"
+DANGER_COLUMN = "是否必要开放"
+SEVERITY_COLUMN = "风险等级"
+REMEDIATION_COLUMN = "整改建议"
+# 规则编译结果的格式版本，变化后旧的磁盘缓存自动失效
+RULES_VERSION = "1"
+
+def user_cache_dir():
+    """当前用户私有的缓存目录（Windows: %LOCALAPPDATA%，其他: $XDG_CACHE_HOME 或 ~/.cache）"""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "nmap-xml2xlsx")
+
+# 不用共享的系统临时目录：那里文件名可预测，其他用户可以预先放入伪造的规则缓存
+RULES_CACHE_DIR = os.path.join(user_cache_dir(), "rules")
+RULE_KEYS = {"name", "ports", "protocol", "services", "severity", "remediation", "label"}
+PORT_SPACE = 65536
+# 只含“任意协议”规则的端口表，用于规则中没有点名的协议
+ANY_PROTOCOL = "*"
+_SERVICE_SPLIT = re.compile(r'[\s/_\-]+')
+_GLOB_CHARS = re.compile(r"[*?\[]")
+_PORT_DIGITS = re.compile(r"^(\d+)$")
+
+def parse_port_ranges(value):
+    """规则中的端口：整数、"N"、"N-M"、逗号分隔的字符串或它们的列表 -> [(起, 止), ...]"""
+    items = value if isinstance(value, list) else [value]
+    ranges = []
+    for item in items:
+        for part in str(item).split(","):
+            part = part.strip()
+            if not part:
+                continue
+            lo, sep, hi = part.partition("-")
+            try:
+                lo = int(lo)
+                hi = int(hi) if sep else lo
+            except ValueError:
+                raise ValueError(f"无效端口: {part}") from None
+            if not 0 <= lo <= hi < PORT_SPACE:
+                raise ValueError(f"端口超出范围: {part}")
+            ranges.append((lo, hi))
+    return ranges
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, (str, int)) else list(value)
+
+class RuleSet:
+    """
+    编译后的暴露面规则。每个协议一张 65536 项的端口表（array('H')，值为命中的规则序号，0 为未命中），
+    规则中没有点名的协议使用只含“任意协议”规则的 * 表；服务名先整体、再按分词精确查字典，
+    最后匹配通配模式，结果按 (服务, 协议) 缓存。端口或服务任一命中即命中该规则，
+    多条规则命中时取文件中靠前的一条。
+    """
+    def __init__(self, rules, port_tables, services, globs):
+        self.rules = rules                  # 序号从 1 开始：rules[i - 1]
+        self.port_tables = port_tables      # {协议: array('H')}
+        self.any_table = port_tables[ANY_PROTOCOL]
+        self.services = services            # {服务名或分词: [规则序号, ...]}
+        self._globs = globs                 # [(正则源码, 规则序号), ...]
+        self._glob_patterns = [(re.compile(rx), rid) for rx, rid in globs]
+        self._protocols = [None] + [set(r["protocols"]) if r["protocols"] else None for r in rules]
+        self._service_cache = {}
+        # 输出列：标注列总是存在，风险等级 / 整改建议只在有规则填写时输出
+        fields = [(DANGER_COLUMN, "label")]
+        if any(r["severity"] for r in rules):
+            fields.append((SEVERITY_COLUMN, "severity"))
+        if any(r["remediation"] for r in rules):
+            fields.append((REMEDIATION_COLUMN, "remediation"))
+        self.columns = [c for c, _ in fields]
+        # outputs[规则序号] -> 输出列取值元组，0 为未命中
+        self.outputs = [("",) * len(fields)] + [tuple(r[k] for _, k in fields) for r in rules]
+
+    @classmethod
+    def compile(cls, specs, default_label=DANGER_LABEL):
+        """校验规则定义（字典列表）并编译为查找表"""
+        if len(specs) >= PORT_SPACE:
+            raise ValueError(f"规则过多（最多 {PORT_SPACE - 1} 条）")
+        rules, services, globs, parsed = [], {}, [], []
+        named = set()
+        for rid, spec in enumerate(specs, 1):
+            if not isinstance(spec, dict):
+                raise ValueError(f"第 {rid} 条规则不是键值映射")
+            unknown = set(spec) - RULE_KEYS
+            if unknown:
+                raise ValueError(f"第 {rid} 条规则有未知字段: {', '.join(sorted(map(str, unknown)))}")
+            protocols = [str(p).strip().lower() for p in _as_list(spec.get("protocol"))]
+            if not protocols or ANY_PROTOCOL in protocols or "any" in protocols:
+                protocols = None
+            else:
+                named.update(protocols)
+            ranges = parse_port_ranges(_as_list(spec.get("ports")))
+            patterns = [str(p).strip().lower() for p in _as_list(spec.get("services")) if str(p).strip()]
+            if not ranges and not patterns:
+                raise ValueError(f"第 {rid} 条规则既没有 ports 也没有 services")
+            rules.append({
+                "name": str(spec.get("name") or f"规则{rid}"),
+                "label": str(spec.get("label") or default_label),
+                "severity": str(spec.get("severity") or ""),
+                "remediation": str(spec.get("remediation") or ""),
+                "protocols": sorted(protocols) if protocols else None,
+            })
+            for pattern in patterns:
+                if _GLOB_CHARS.search(pattern):
+                    globs.append((fnmatch.translate(pattern), rid))
+                else:
+                    services.setdefault(pattern, []).append(rid)
+            parsed.append((rid, ranges, protocols))
+
+        port_tables = {}
+        for proto in [ANY_PROTOCOL] + sorted(named):
+            table = array("H", bytes(2 * PORT_SPACE))
+            # 倒序写入：靠前的规则最后写，覆盖靠后的
+            for rid, ranges, protocols in reversed(parsed):
+                if protocols is None or proto in protocols:
+                    for lo, hi in ranges:
+                        table[lo:hi + 1] = array("H", [rid]) * (hi - lo + 1)
+            port_tables[proto] = table
+        return cls(rules, port_tables, services, globs)
+
+    def to_bytes(self):
+        """序列化（zlib 压缩的 JSON 头 + 各协议端口表的原始字节），用于磁盘缓存"""
+        protocols = list(self.port_tables)
+        meta = {"version": RULES_VERSION, "rules": self.rules, "services": self.services,
+                "globs": self._globs, "protocols": protocols}
+        header = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return zlib.compress(header + b"\n" + b"".join(self.port_tables[p].tobytes() for p in protocols))
+
+    @classmethod
+    def from_bytes(cls, blob):
+        header, _, body = zlib.decompress(blob).partition(b"\n")
+        meta = json.loads(header)
+        if meta.get("version") != RULES_VERSION:
+            raise ValueError("规则缓存版本不符")
+        size = 2 * PORT_SPACE
+        if len(body) != size * len(meta["protocols"]):
+            raise ValueError("规则缓存已损坏")
+        port_tables = {}
+        for i, proto in enumerate(meta["protocols"]):
+            table = array("H")
+            table.frombytes(body[i * size:(i + 1) * size])
+            port_tables[proto] = table
+        return cls(meta["rules"], port_tables, meta["services"], [tuple(g) for g in meta["globs"]])
+
+    def port_table(self, protocol):
+        return self.port_tables.get(protocol, self.any_table)
+
+    def service_rule(self, service, protocol):
+        """服务名（已 strip + lower）在该协议下命中的规则序号，0 为未命中"""
+        key = (service, protocol)
+        rid = self._service_cache.get(key)
+        if rid is None:
+            rid = self._service_cache[key] = self._match_service(service, protocol)
+        return rid
+
+    def _match_service(self, service, protocol):
+        if not service:
+            return 0
+        tokens = [service] + _SERVICE_SPLIT.split(service)
+        hits = set()
+        for token in tokens:
+            hits.update(self.services.get(token, ()))
+        for pattern, rid in self._glob_patterns:
+            if rid not in hits and any(pattern.match(t) for t in tokens):
+                hits.add(rid)
+        for rid in sorted(hits):
+            protocols = self._protocols[rid]
+            if protocols is None or protocol in protocols:
+                return rid
+        return 0
+
+    def classify(self, port, protocol, service):
+        """单行分类：端口查表与服务匹配取靠前的规则，返回规则序号（0 为未命中）"""
+        by_port = self.port_table(protocol)[port] if 0 <= port < PORT_SPACE else 0
+        by_service = self.service_rule(service, protocol)
+        return by_port if by_port and (not by_service or by_port < by_service) else by_service
+
+def default_rule_specs():
+    """脚本内置的规则：dangerous_ports / dangerous_services，任意协议，端口或服务命中即危险"""
+    return [{"name": "内置危险端口/服务", "ports": sorted(dangerous_ports), "services": sorted(dangerous_services)}]
+
+def parse_rule_file(file_path, data):
+    """
+    解析规则文件内容（YAML 或 JSON），返回 (规则定义列表, 默认标注)。
+    顶层可以直接是规则列表，也可以是 {label, include_default, rules}；
+    include_default 为真时把内置规则追加在文件规则之后（优先级最低）。
+    """
+    if file_path.lower().endswith((".yaml", ".yml")):
         try:
-            port_str = str(row.get("端口/协议", "")).split("/")[0]
-            if port_str and re.match(r"^\d+$", port_str):
-                port = int(port_str)
-        except Exception:
-            port = None
-        service = str(row.get("服务", "")).strip().lower()
-        # check service tokens
-        service_tokens = set(re.split(r'[\s/_\-]+', service))
-        if (port in dangerous_ports) or (service and (service in dangerous_services or bool(service_tokens & dangerous_services))):
-            return "危险端口不允许对外开放"
-        return ""
-    df["是否必要开放"] = df.apply(check, axis=1)
+            import yaml
+        except ImportError:
+            raise ValueError("读取 YAML 规则需要安装 PyYAML（pip install pyyaml），或改用 JSON 格式") from None
+        doc = yaml.safe_load(data)
+    else:
+        doc = json.loads(data.decode("utf-8-sig"))
+    label = DANGER_LABEL
+    include_default = False
+    if isinstance(doc, dict):
+        label = str(doc.get("label") or DANGER_LABEL)
+        include_default = bool(doc.get("include_default"))
+        doc = doc.get("rules")
+    if not isinstance(doc, list):
+        raise ValueError("规则文件应为规则列表，或包含 rules 列表的映射")
+    specs = list(doc)
+    if include_default:
+        specs += [dict(spec, label=label) for spec in default_rule_specs()]
+    return specs, label
+
+def is_private_path(st):
+    """属主为当前用户且组/其他用户不可写（Windows 上没有 uid，只靠用户目录本身的权限）"""
+    if not hasattr(os, "getuid"):
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def load_rules(file_path, cache_dir=RULES_CACHE_DIR):
+    """
+    读取并编译规则文件。编译结果按 文件内容哈希（连同内置规则与格式版本）缓存在 cache_dir，
+    规则未改动时直接载入端口表，不再解析 YAML / 重新编译。
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps([RULES_VERSION, default_rule_specs()], ensure_ascii=False).encode("utf-8"))
+    cache_path = os.path.join(cache_dir, f"{digest.hexdigest()}.rules") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                if not (is_private_path(os.stat(cache_dir)) and is_private_path(os.fstat(f.fileno()))):
+                    raise ValueError("缓存文件或目录不属于当前用户，或可被其他用户写入")
+                rules = RuleSet.from_bytes(f.read())
+            logger.debug(f"规则缓存命中: {cache_path}")
+            return rules
+        except Exception as e:
+            logger.debug(f"规则缓存 {cache_path} 无效，重新编译: {e}")
+
+    rules = RuleSet.compile(*parse_rule_file(file_path, data))
+    if cache_path:
+        tmp_path = None
+        try:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            tmp_fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+            with os.fdopen(tmp_fd, "wb") as f:
+                f.write(rules.to_bytes())
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.debug(f"写入规则缓存失败: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return rules
+
+# 当前生效的规则（--rules 指定时在 main 中替换）
+danger_rules = RuleSet.compile(default_rule_specs())
+
+def _factorize_normalized(series):
+    """整列 factorize，只对唯一值做 strip + lower；返回 (编码, 唯一值列表)，缺失值编码指向末尾的空串"""
+    codes, uniques = pd.factorize(series)
+    values = [str(v).strip().lower() for v in uniques]
+    return np.where(codes < 0, len(values), codes), values + [""]
+
+def port_number(text):
+    """端口原文或 "端口/协议" -> 端口号（"/" 前为纯数字且在 0-65535 内，否则 NO_PORT）"""
+    digits = _PORT_DIGITS.match(text.split("/", 1)[0])
+    if digits is None:
+        return NO_PORT
+    port = int(digits.group(1))
+    return port if port < PORT_SPACE else NO_PORT
+
+def mark_dangerous(df, rules=None):
+    """
+    向量化标注：端口号按协议整列查端口表（规则不区分协议时只查一次），
+    端口原文 / "端口/协议" 只对唯一值提取端口号，服务只对 (服务, 协议) 的唯一组合做匹配，
+    再按 factorize 编码整列展开；结果与逐行 RuleSet.classify 一致。
+    """
+    rules = rules or danger_rules
+    n = len(df)
+    port = np.full(n, NO_PORT, dtype=np.int64)
+    if "端口" in df.columns:
+        port = df["端口"].astype("Int64").fillna(NO_PORT).to_numpy(dtype=np.int64)
+    for col in (PORT_TEXT_COLUMN, "端口/协议"):
+        if col in df.columns:
+            missing = port == NO_PORT
+            if missing.any():
+                codes, uniques = pd.factorize(df[col])
+                numbers = np.array([port_number(str(v)) for v in uniques] + [NO_PORT], dtype=np.int64)
+                port = np.where(missing, numbers[codes], port)
+
+    if "协议" in df.columns:
+        proto_codes, protocols = _factorize_normalized(df["协议"])
+    elif "端口/协议" in df.columns:
+        proto_codes, protocols = _factorize_normalized(df["端口/协议"].astype(str).str.partition("/")[2])
+    else:
+        proto_codes, protocols = np.zeros(n, dtype=np.intp), [""]
+    if "服务" in df.columns:
+        svc_codes, services = _factorize_normalized(df["服务"])
+    else:
+        svc_codes, services = np.zeros(n, dtype=np.intp), [""]
+
+    by_port = np.zeros(n, dtype=np.uint16)
+    valid = (port >= 0) & (port < PORT_SPACE)
+    tables = [rules.port_table(p) for p in protocols]
+    if all(t is tables[0] for t in tables):
+        by_port[valid] = np.frombuffer(tables[0], dtype=np.uint16)[port[valid]]
+    else:
+        for code, table in enumerate(tables):
+            rows = valid & (proto_codes == code)
+            by_port[rows] = np.frombuffer(table, dtype=np.uint16)[port[rows]]
+    service_table = np.array([[rules.service_rule(s, p) for p in protocols] for s in services], dtype=np.uint16)
+    by_service = service_table[svc_codes, proto_codes]
+    rule = np.where((by_port != 0) & ((by_service == 0) | (by_port < by_service)), by_port, by_service)
+
+    for j, col in enumerate(rules.columns):
+        values = np.array([out[j] for out in rules.outputs], dtype=object)
+        df[col] = values[rule]
     return df
 
+# ===========================
+# Excel 样式定义（format_excel 与流式写出共用）
+# ===========================
+EXCEL_COLUMN_WIDTHS = {"A":36,"B":12,"C":12,"D":18,"E":11,"F":28}
+EXCEL_DEFAULT_WIDTH = 18
+
+def excel_styles():
+    """返回 (表头, 正文, 危险) 三个命名样式"""
+    from openpyxl.styles import Font, PatternFill, Alignment, NamedStyle
+    header_fill = PatternFill(start_color="FFD9D9D9", end_color="FFD9D9D9", fill_type="solid")
+    header = NamedStyle(name="report_header", font=Font(name="宋体", size=12, bold=True), fill=header_fill,
+                        alignment=Alignment(horizontal="center", vertical="center", wrap_text=True))
+    body = NamedStyle(name="report_body", font=Font(name="宋体", size=12),
+                      alignment=Alignment(vertical="top", wrap_text=True))
+    danger = NamedStyle(name="report_danger", font=Font(name="宋体", size=12, color="FFFF0000"),
+                        alignment=Alignment(vertical="top", wrap_text=True))
+    return header, body, danger
+
 # ===========================
 # Excel 美化（冻结表头、自动筛选、表头样式）
 # ===========================
 def format_excel(file_path):
+    """对已有的 xlsx 做同样的美化（需整本载入内存，生成报表请用 write_excel）"""
+    from openpyxl import load_workbook
+    from openpyxl.utils import get_column_letter
     try:
         wb = load_workbook(file_path)
         ws = wb.active
 
-        font = Font(name="宋体", size=12)
-        bold_font = Font(name="宋体", size=12, bold=True)
-        red_font = Font(name="宋体", size=12, color="FFFF0000")
-        header_fill = PatternFill(start_color="FFD9D9D9", end_color="FFD9D9D9", fill_type="solid")
-        align = Alignment(horizontal="center", vertical="center", wrap_text=True)
+        header_style, body_style, danger_style = excel_styles()
+        for style in (header_style, body_style, danger_style):
+            # 本工具写出的报表里已注册过同名样式，重复注册会报错
+            if style.name not in wb.named_styles:
+                wb.add_named_style(style)
 
-        column_widths = {"A":36,"B":12,"C":12,"D":18,"E":11,"F":28}
         # 基于现有列数设置（避免列名短于映射）
-        for i, col in enumerate(ws.iter_cols(1, ws.max_column), start=1):
-            col_letter = col[0].column_letter
-            width = column_widths.get(col_letter, 18)
-            ws.column_dimensions[col_letter].width = width
+        for col_idx in range(1, ws.max_column + 1):
+            col_letter = get_column_letter(col_idx)
+            ws.column_dimensions[col_letter].width = EXCEL_COLUMN_WIDTHS.get(col_letter, EXCEL_DEFAULT_WIDTH)
 
         # header 行格式化
         for cell in ws[1]:
-            cell.font = bold_font
-            cell.fill = header_fill
-            cell.alignment = align
+            cell.style = header_style.name
 
-        # 其他行基础字体
+        # 其他行基础字体，危险标注为红色
+        danger_col = next((cell.column for cell in ws[1] if cell.value == DANGER_COLUMN), None)
         for row in ws.iter_rows(min_row=2):
             for cell in row:
-                cell.font = font
-                cell.alignment = Alignment(vertical="top", wrap_text=True)
-
-                if cell.value == "危险端口不允许对外开放":
-                    cell.font = red_font
+                cell.style = danger_style.name if cell.column == danger_col and cell.value else body_style.name
 
         # 冻结首行
         ws.freeze_panes = "A2"
@@ -432,39 +1665,962 @@ def format_excel(file_path):
     except Exception as e:
         logger.error(f"格式化 Excel 失败: {e}")
 
+# ===========================
+# 流式写出带格式的 Excel（write-only 工作簿，一次写成）
+# ===========================
+EXCEL_MAX_ROWS = 1048576  # Excel 单个工作表的行数上限（含表头）
+INDEX_SHEET_TITLE = "索引"
+# write_excel 每次从 DataFrame 取出并转换的行数，转换的中间结果只与块大小有关
+EXCEL_WRITE_CHUNK_ROWS = 10000
+
+def excel_cell_value(value):
+    """缺失值（None / NaN / NaT / pd.NA）写为空单元格，其余原样写出"""
+    if value is None or type(value).__name__ in ("NAType", "NaTType"):
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+class ExcelReportWriter:
+    """
+    使用 openpyxl write-only 工作簿逐行写出最终报表，样式在写入时直接套用共享的命名样式，
+    冻结首行、列宽、自动筛选也在写入过程中设置，不需要先 to_excel 再整本载入美化。
+    行写出后即落到临时文件，内存占用与行数无关。
+    数据行超过单表上限时自动切换到新工作表（Sheet2、Sheet3 ...），每个分表格式相同，
+    并在末尾追加“索引”表列出各分表的行范围。
+    """
+    def __init__(self, file_path, columns, sheet_title="Sheet1", max_rows_per_sheet=EXCEL_MAX_ROWS - 1):
+        self.file_path = file_path
+        self.columns = list(columns)
+        self.sheet_title = sheet_title
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.rows = 0
+        self.shards = []
+        from openpyxl import Workbook
+        from openpyxl.utils import get_column_letter
+        self._wb = Workbook(write_only=True)
+        self._styles = excel_styles()
+        for style in self._styles:
+            self._wb.add_named_style(style)
+        self._last_col = get_column_letter(max(1, len(self.columns)))
+        self._ws = None
+        self._new_sheet()
+
+    def _new_sheet(self):
+        from openpyxl.utils import get_column_letter
+        index = len(self.shards) + 1
+        title = self.sheet_title if index == 1 else f"Sheet{index}"
+        self._ws = self._wb.create_sheet(title)
+        for col_idx in range(1, len(self.columns) + 1):
+            col_letter = get_column_letter(col_idx)
+            self._ws.column_dimensions[col_letter].width = EXCEL_COLUMN_WIDTHS.get(col_letter, EXCEL_DEFAULT_WIDTH)
+        self._ws.freeze_panes = "A2"
+        self.shards.append({"title": title, "first": self.rows + 1, "rows": 0})
+
+        # 每列的模板单元格，append 时立即序列化，因此可逐行复用；
+        # 只有标注列另备一个危险样式的单元格（其余列两者为同一对象），标注非空即标红
+        header_style, body_style, danger_style = self._styles
+        self._body_cells = [self._styled_cell(body_style.name) for _ in self.columns]
+        self._danger_cells = [self._styled_cell(danger_style.name) if name == DANGER_COLUMN else body
+                              for name, body in zip(self.columns, self._body_cells)]
+        header = []
+        for name in self.columns:
+            cell = self._styled_cell(header_style.name)
+            cell.value = name
+            header.append(cell)
+        self._ws.append(header)
+
+    def _finish_sheet(self):
+        shard = self.shards[-1]
+        self._ws.auto_filter.ref = f"A1:{self._last_col}{shard['rows'] + 1}"
+
+    def _styled_cell(self, style_name):
+        from openpyxl.cell import WriteOnlyCell
+        cell = WriteOnlyCell(self._ws)
+        cell.style = style_name
+        return cell
+
+    def write_row(self, values):
+        shard = self.shards[-1]
+        if shard["rows"] >= self.max_rows_per_sheet:
+            self._finish_sheet()
+            self._new_sheet()
+            shard = self.shards[-1]
+        row = []
+        for value, body, danger in zip(values, self._body_cells, self._danger_cells):
+            value = excel_cell_value(value)
+            cell = danger if danger is not body and value else body
+            cell.value = value
+            row.append(cell)
+        self._ws.append(row)
+        shard["rows"] += 1
+        self.rows += 1
+
+    def write_rows(self, rows):
+        for values in rows:
+            self.write_row(values)
+
+    def _write_index(self):
+        from openpyxl.cell import WriteOnlyCell
+        header_style, body_style, _ = self._styles
+        ws = self._wb.create_sheet(INDEX_SHEET_TITLE)
+        for col_letter, width in zip("ABCD", (18, 14, 14, 14)):
+            ws.column_dimensions[col_letter].width = width
+        ws.freeze_panes = "A2"
+        header = []
+        for name in ("工作表", "起始序号", "结束序号", "行数"):
+            cell = WriteOnlyCell(ws, value=name)
+            cell.style = header_style.name
+            header.append(cell)
+        ws.append(header)
+        for shard in self.shards:
+            values = (shard["title"], shard["first"], shard["first"] + shard["rows"] - 1, shard["rows"])
+            row = []
+            for value in values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = body_style.name
+                row.append(cell)
+            ws.append(row)
+        ws.append([WriteOnlyCell(ws, value="合计"), None, None, WriteOnlyCell(ws, value=self.rows)])
+
+    def close(self):
+        self._finish_sheet()
+        if len(self.shards) > 1:
+            self._write_index()
+            logger.info(f"共 {self.rows} 行，超过单表上限，已拆分为 {len(self.shards)} 个工作表")
+        self._wb.save(self.file_path)
+
+def write_excel(df, file_path, chunk_rows=EXCEL_WRITE_CHUNK_ROWS):
+    """
+    把 DataFrame 写成带格式的 xlsx（缺失值写为空单元格）。
+    按固定行数分块取出，不为整张表生成 object 副本，额外内存只与块大小有关。
+    """
+    writer = ExcelReportWriter(file_path, df.columns)
+    for start in range(0, len(df), chunk_rows):
+        writer.write_rows(df.iloc[start:start + chunk_rows].itertuples(index=False, name=None))
+    writer.close()
+
+# ===========================
+# 输出格式（xlsx/csv/jsonl 为展示格式，parquet/feather 为紧凑列式格式）
+# ===========================
+OUTPUT_FORMATS = {
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "jsonl": ".jsonl",
+}
+# 需要 pyarrow 的格式
+ARROW_FORMATS = {"parquet", "feather"}
+
+def detect_format(output_file, fmt=None):
+    """未显式指定 --format 时按输出文件扩展名推断，无法推断则为 xlsx"""
+    if fmt:
+        return fmt
+    ext = os.path.splitext(output_file)[1].lower()
+    for name, suffix in OUTPUT_FORMATS.items():
+        if ext == suffix:
+            return name
+    return "xlsx"
+
+def to_columnar_frame(df):
+    """
+    内部列 -> 紧凑列式输出：端口保持整数（Int32，可空），协议、状态、服务、标注为类别型，
+    供 parquet/feather 使用。
+    """
+    out = pd.DataFrame(index=df.index)
+    out["IP"] = df["IP"].astype(str)
+    out["端口"] = df["端口"].astype("Int32")
+    for col in ("协议", "状态", "服务"):
+        out[col] = df[col].astype(str).astype("category")
+    out["端口用途"] = df["端口用途"].astype(str)
+    for col in df.columns:
+        if col not in out.columns:
+            out[col] = df[col].astype("category") if col in (DANGER_COLUMN, SEVERITY_COLUMN) else df[col]
+    return out.reset_index(drop=True)
+
+def write_report(df, file_path, fmt="xlsx"):
+    """按格式写出报表（df 为内部列，写到 file_path，调用方负责临时文件与替换）"""
+    if fmt in ARROW_FORMATS:
+        columnar = to_columnar_frame(df)
+        if fmt == "parquet":
+            columnar.to_parquet(file_path, index=False)
+        else:
+            columnar.to_feather(file_path)
+        return
+    # 展示列只在这里生成
+    display = to_display_frame(df)
+    if fmt == "xlsx":
+        write_excel(display, file_path)
+    elif fmt == "csv":
+        # 带 BOM，Excel 直接打开中文不乱码
+        display.to_csv(file_path, index=False, encoding="utf-8-sig")
+    elif fmt == "jsonl":
+        display.astype(object).where(display.notna(), None).to_json(
+            file_path, orient="records", lines=True, force_ascii=False)
+    else:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+
+def save_report(df, output_file, fmt="xlsx"):
+    """原子写入：先写临时文件再替换目标文件，成功返回 True"""
+    return atomic_save(output_file, fmt, lambda tmp_path: write_report(df, tmp_path, fmt))
+
+def atomic_save(output_file, fmt, write, announce=True):
+    """write(tmp_path) 写出临时文件，成功后替换 output_file；成功返回 True"""
+    tmp_fd, tmp_path = tempfile.mkstemp(suffix=OUTPUT_FORMATS[fmt])
+    os.close(tmp_fd)
+    try:
+        write(tmp_path)
+        # 替换目标文件（原子）
+        shutil.move(tmp_path, output_file)
+        if announce:
+            logger.info(f"处理完成，结果保存为 {output_file}")
+        return True
+    except Exception as e:
+        logger.error(f"保存输出文件失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
 # ===========================
 # 去重逻辑（归一化后去重）
 # ===========================
+DEDUP_COLUMNS = ["IP","端口","协议","服务","状态","端口用途",PORT_TEXT_COLUMN,"端口/协议"]
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_value(value) -> str:
+    """去重前的字段归一化：合并连续空白、去首尾空白、转小写"""
+    return _WHITESPACE.sub(' ', str(value)).strip().lower()
+
+def normalize_categorical(series):
+    """
+    把一列转成归一化后的 Categorical：只对唯一值做归一化，
+    归一化后相同的值合并为同一个类别，缺失值归为空串。
+    """
+    codes, uniques = pd.factorize(series)
+    normalized = (pd.Series(uniques, dtype=object).astype(str)
+                  .str.replace(r'\s+', ' ', regex=True).str.strip().str.lower())
+    # 末尾追加 ""，缺失值编码 -1 正好映射到它
+    norm_codes, categories = pd.factorize(pd.concat([normalized, pd.Series([""])], ignore_index=True))
+    return pd.Categorical.from_codes(norm_codes[codes], categories=categories)
+
 def auto_dedup(df):
     if df.empty:
         return df, "none"
     before = len(df)
-    # 先归一化关键字段
-    for col in ["IP","端口/协议","服务","状态","端口用途"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str).fillna("").map(lambda x: re.sub(r'\s+', ' ', x).strip().lower())
-    df.drop_duplicates(subset=["IP","端口/协议","服务","状态","端口用途"], inplace=True)
+    # 先归一化关键字段（类别化，仅处理唯一值），再按类别编码去重；整数端口直接用其编码
+    codes = {}
+    for col in DEDUP_COLUMNS:
+        if col not in df.columns:
+            continue
+        if col == "端口":
+            codes[col] = pd.factorize(df[col])[0]
+        else:
+            df[col] = normalize_categorical(df[col])
+            codes[col] = df[col].cat.codes.to_numpy()
+    df = df.loc[~pd.DataFrame(codes).duplicated().to_numpy()]
     after = len(df)
     mode = f"strict ({before-after} 行被删除)"
     return df, mode
 
+class StreamingDeduper:
+    """
+    流式去重：在解析器还在产出记录时就丢弃重复记录。
+    键为 (IP, 端口, 归一化后的协议/服务/状态/用途/端口原文) 元组，存放在哈希集合中；
+    字符串归一化结果按原始值缓存，因此开销主要与不同取值的数量相关。保留每个键第一次出现的记录。
+    """
+    def __init__(self):
+        self.dropped = 0
+        self._seen = set()
+        self._norm = {}
+
+    def _normalize(self, value):
+        norm = self._norm.get(value)
+        if norm is None:
+            norm = self._norm[value] = sys.intern(normalize_value(value))
+        return norm
+
+    def _key(self, ip, port, protocol, service, state, remark, port_text):
+        norm = self._normalize
+        return (ip if isinstance(ip, bytes) else norm(ip), port, norm(protocol), norm(service),
+                norm(state), norm(remark), norm(port_text or ""))
+
+    def add(self, rec) -> bool:
+        """rec 为 PortRecord；首次出现返回 True，重复返回 False"""
+        key = self._key(rec.ip, rec.port, rec.protocol, rec.service, rec.state, rec.remark, rec.port_text)
+        if key in self._seen:
+            self.dropped += 1
+            return False
+        self._seen.add(key)
+        return True
+
+    def filter(self, records):
+        for rec in records:
+            if self.add(rec):
+                yield rec
+
+    def filter_columns(self, batch):
+        """对列式批次（RecordColumns）去重，返回只含首次出现记录的批次"""
+        seen = self._seen
+        key = self._key
+        port_text = batch.port_text
+        keep = []
+        rows = zip(batch.ip, batch.port, batch.protocol, batch.service, batch.state, batch.remark)
+        for i, (ip, port, protocol, service, state, remark) in enumerate(rows):
+            k = key(ip, port, protocol, service, state, remark, port_text.get(i))
+            if k in seen:
+                continue
+            seen.add(k)
+            keep.append(i)
+        self.dropped += len(batch) - len(keep)
+        if len(keep) == len(batch):
+            return batch
+        return batch.take(keep)
+
+# ===========================
+# 轻量路径：只有少量 XML 时不导入 pandas，逐行处理后流式写出
+# ===========================
+LITE_FORMATS = {"xlsx", "csv", "jsonl"}
+LITE_MAX_ROWS = 200000
+REPORT_COLUMNS = ROW_COLUMNS + [DANGER_COLUMN]
+
+def iter_report_rows(records):
+    """
+    逐行实现 auto_dedup -> mark_dangerous -> to_display_frame：字段归一化、
+    按 (IP, 端口, 协议, 服务, 状态, 用途, 端口原文) 去重并保留首次出现、标注危险，
+    产出展示列（见 report_columns）的行元组，与 pandas 路径的结果一致。
+    """
+    rules = danger_rules
+    outputs = rules.outputs
+    norm_cache = {}
+    seen = set()
+
+    def norm(value):
+        out = norm_cache.get(value)
+        if out is None:
+            out = norm_cache[value] = normalize_value(value)
+        return out
+
+    for rec in records:
+        ip, protocol, state = norm(rec.ip_text), norm(rec.protocol), norm(rec.state)
+        service, remark = norm(rec.service), norm(rec.remark)
+        port_text = norm(rec.port_text) if rec.port_text is not None else ""
+        key = (ip, rec.port, protocol, service, state, remark, port_text)
+        if key in seen:
+            continue
+        seen.add(key)
+        port = rec.port if rec.port != NO_PORT else port_number(port_text)
+        rule = rules.classify(port, protocol.strip().lower(), service.strip().lower())
+        row = (ip, format_port_proto(rec.port, protocol, port_text), state, service, remark)
+        if rec.extra is not None:
+            row += rec.extra
+        yield row + outputs[rule]
+
+def report_columns(extra_columns=()):
+    """轻量路径的展示列：基础列 + --fields 额外字段 + 规则输出列（标注，以及规则填写了的风险等级 / 整改建议）"""
+    return ROW_COLUMNS + list(extra_columns) + danger_rules.columns
+
+class RowStreamWriter:
+    """csv / jsonl 逐行写出展示列（不缓存），与 DataFrame.to_csv / to_json(lines=True) 的结果一致"""
+    def __init__(self, file_path, fmt, columns=REPORT_COLUMNS):
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.rows = 0
+        if fmt == "csv":
+            import csv
+            # 带 BOM，行尾为 os.linesep（与 to_csv 相同）
+            self._fh = open(file_path, "w", encoding="utf-8-sig", newline="")
+            self._csv = csv.writer(self._fh, lineterminator=os.linesep)
+            self._csv.writerow(self.columns)
+        elif fmt == "jsonl":
+            self._fh = open(file_path, "w", encoding="utf-8")
+        else:
+            raise ValueError(f"不支持流式写出的格式: {fmt}")
+
+    def write_row(self, row):
+        if self.fmt == "csv":
+            self._csv.writerow(row)
+        else:
+            self._fh.write(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, separators=(",", ":")))
+            self._fh.write("\n")
+        self.rows += 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+def write_rows_report(rows, file_path, fmt="xlsx", columns=REPORT_COLUMNS):
+    """把展示列的行元组流式写出为 xlsx/csv/jsonl（只用标准库与 openpyxl），返回行数"""
+    if fmt not in LITE_FORMATS:
+        raise ValueError(f"轻量路径不支持的输出格式: {fmt}")
+    writer = ExcelReportWriter(file_path, columns) if fmt == "xlsx" else RowStreamWriter(file_path, fmt, columns)
+    try:
+        writer.write_rows(rows)
+    finally:
+        writer.close()
+    return writer.rows
+
+def save_rows_report(records, output_file, fmt="xlsx", extra_columns=()):
+    """轻量路径：去重、标注后原子写出，返回写出的行数（失败返回 None）"""
+    result = {}
+
+    def write(tmp_path):
+        result["rows"] = write_rows_report(iter_report_rows(records), tmp_path, fmt, report_columns(extra_columns))
+
+    if not atomic_save(output_file, fmt, write):
+        return None
+    logger.info(f"轻量模式（未加载 pandas）：最终 {result['rows']} 行")
+    return result["rows"]
+
+def lite_unsupported(fmt, baseline=None, scope=None):
+    """轻量路径不支持的原因（None 表示可以走轻量路径）"""
+    if fmt not in LITE_FORMATS:
+        return f"输出格式 {fmt}"
+    if baseline is not None:
+        return "--baseline"
+    if scope is not None:
+        return "--scope/--exclude"
+    return None
+
+# ===========================
+# 实时跟随（--follow）：边扫描边解析仍在增长的 -oX 文件或 nmap -oX - 管道
+# ===========================
+FOLLOW_CHUNK_SIZE = 1 << 16
+
+def iter_follow_events(stream, is_pipe, on_idle=None, poll_interval=1.0, timeout=0):
+    """
+    用 XMLPullParser 增量解析：读到多少喂多少，产出已完整的 (event, elem)。
+    根节点闭合即结束；管道读到 EOF、或文件超过 timeout 秒无新内容（timeout 为 0 表示一直等待）时，
+    以不完整的尾部结束而不报错。on_idle() 在每次等待新数据之前调用（用于刷新输出）。
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    depth = 0
+    idle = 0.0
+    read = stream.read1 if hasattr(stream, "read1") else stream.read
+    while True:
+        if on_idle is not None:
+            on_idle()
+        chunk = read(FOLLOW_CHUNK_SIZE)
+        if not chunk:
+            if is_pipe:
+                break
+            if timeout and idle >= timeout:
+                logger.warning(f"{timeout} 秒内没有新内容，停止跟随")
+                break
+            time.sleep(poll_interval)
+            idle += poll_interval
+            continue
+        idle = 0.0
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            depth += 1 if event == "start" else -1
+            yield event, elem
+            if depth == 0:
+                return
+    if depth > 0:
+        logger.warning("输入在 XML 结束之前中断（扫描可能未完成），已保留所有已闭合的 host")
+
+class SnapshotReportSink:
+    """xlsx 输出：行累积在内存，每隔 interval 秒（以及结束时）原子重写一次完整快照"""
+    def __init__(self, output_file, fmt, interval, columns=REPORT_COLUMNS):
+        self.output_file = output_file
+        self.fmt = fmt
+        self.interval = interval
+        self.columns = columns
+        self._rows = []
+        self._written = 0
+        self._last = time.monotonic()
+
+    @property
+    def count(self):
+        return len(self._rows)
+
+    def write_row(self, row):
+        self._rows.append(row)
+
+    def checkpoint(self, force=False):
+        if len(self._rows) == self._written:
+            return
+        if not force and time.monotonic() - self._last < self.interval:
+            return
+        if atomic_save(self.output_file, self.fmt, lambda p: write_rows_report(self._rows, p, self.fmt, self.columns), announce=False):
+            self._written = len(self._rows)
+            logger.info(f"快照已更新: {self.output_file}（{self._written} 行）")
+        self._last = time.monotonic()
+
+    def close(self):
+        self.checkpoint(force=True)
+
+class StreamReportSink:
+    """csv / jsonl 输出：逐行追加到目标文件，每次等待新数据前刷新到磁盘"""
+    def __init__(self, output_file, fmt, columns=REPORT_COLUMNS):
+        self.output_file = output_file
+        self._writer = RowStreamWriter(output_file, fmt, columns)
+
+    @property
+    def count(self):
+        return self._writer.rows
+
+    def write_row(self, row):
+        self._writer.write_row(row)
+
+    def checkpoint(self, force=False):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+def follow_nmap_xml(source, output_file, fmt, scope=None, poll_interval=1.0, timeout=0, snapshot_interval=30,
+                    fields=None):
+    """
+    跟随 source（文件路径，"-" 为标准输入）：每个 host 闭合即解析，经范围过滤、
+    流式去重与危险标注后写入输出（csv/jsonl 逐行追加，xlsx 定期快照）。返回写出的行数。
+    """
+    is_pipe = source == "-"
+    stream = sys.stdin.buffer if is_pipe else open(source, "rb")
+    columns = report_columns(fields.columns if fields else ())
+    if fmt == "xlsx":
+        sink = SnapshotReportSink(output_file, fmt, snapshot_interval, columns)
+    else:
+        sink = StreamReportSink(output_file, fmt, columns)
+    name = "<stdin>" if is_pipe else source
+    logger.info(f"开始跟随 {name} -> {output_file}（Ctrl+C 结束并写出当前结果）")
+
+    def host_records():
+        events = iter_follow_events(stream, is_pipe, on_idle=sink.checkpoint,
+                                    poll_interval=poll_interval, timeout=timeout)
+        records = iter_host_records(events, name, fields=fields)
+        if scope is None:
+            return records
+        return (rec for rec in records if scope.keep(rec.ip))
+
+    try:
+        for row in iter_report_rows(host_records()):
+            sink.write_row(row)
+    except KeyboardInterrupt:
+        logger.warning("已中断跟随，写出当前结果")
+    except ET.ParseError as e:
+        logger.error(f"解析 {name} 出错（{e}），已保留此前闭合的 host")
+    finally:
+        sink.close()
+        if not is_pipe:
+            stream.close()
+    rows = sink.count
+    logger.info(f"跟随结束，共写出 {rows} 行: {output_file}")
+    return rows
+
+# ===========================
+# 与基线报表对比
+# ===========================
+DIFF_COLUMN = "变化"
+DIFF_NEW = "新增"
+DIFF_CLOSED = "已关闭"
+DIFF_SERVICE_CHANGED = "服务变更"
+DIFF_STATE_CHANGED = "状态变更"
+DIFF_UNCHANGED = "未变化"
+DIFF_KEY_COLUMNS = ["IP", "端口", "协议", PORT_TEXT_COLUMN]
+
+def load_baseline(file_path):
+    """
+    读取上一次的报表（xlsx/csv/jsonl/parquet/feather），沿用表格解析的列别名，并按同样规则去重。
+    基线本身是对比结果时，其中标为“已关闭”的行是更早之前的记录，不属于基线，读取时去掉。
+    """
+    df = parse_table(file_path, keep_columns=(DIFF_COLUMN,))
+    if DIFF_COLUMN in df.columns:
+        closed = df[DIFF_COLUMN] == DIFF_CLOSED
+        if closed.any():
+            logger.info(f"基线 {file_path} 中 {int(closed.sum())} 条“已关闭”记录不计入基线")
+        df = df.loc[~closed].drop(columns=DIFF_COLUMN).reset_index(drop=True)
+    df, _ = auto_dedup(df)
+    return df
+
+def _diff_keys(df):
+    """
+    连接键：(IP, 端口, 协议, 端口原文) 以及归一化后的服务、状态。
+    端口为整数，非数字端口靠端口原文区分。
+    """
+    keys = pd.DataFrame(index=df.index)
+    keys["IP"] = df["IP"].astype(str)
+    keys["端口"] = df["端口"].astype("Int64").fillna(NO_PORT).astype("int64")
+    keys["协议"] = df["协议"].astype(str).str.strip().str.lower()
+    port_text = df[PORT_TEXT_COLUMN] if PORT_TEXT_COLUMN in df.columns else pd.Series("", index=df.index)
+    keys[PORT_TEXT_COLUMN] = port_text.astype(object).where(port_text.notna(), "").astype(str)
+    for col in ("服务", "状态"):
+        keys[col] = normalize_categorical(df[col]).astype(str)
+    return keys
+
+def _key_isin(left, right, columns):
+    """left 的每一行在 right 中是否存在相同的 columns 组合（哈希查找）"""
+    return pd.MultiIndex.from_frame(left[columns]).isin(pd.MultiIndex.from_frame(right[columns]))
+
+def diff_against_baseline(df, baseline):
+    """
+    当前结果与基线按 (IP, 端口, 协议) 做哈希连接，在“变化”列标注：
+    完全相同为未变化；键相同、服务相同但状态不同为状态变更；键相同但服务不同为服务变更；键不存在为新增。
+    基线中键在当前结果里完全消失的记录以“已关闭”追加在末尾。
+    """
+    cur = _diff_keys(df)
+    base = _diff_keys(baseline)
+    on_key = _key_isin(cur, base, DIFF_KEY_COLUMNS)
+    same_service = _key_isin(cur, base, DIFF_KEY_COLUMNS + ["服务"])
+    same_row = _key_isin(cur, base, DIFF_KEY_COLUMNS + ["服务", "状态"])
+    status = np.select(
+        [same_row, same_service, on_key],
+        [DIFF_UNCHANGED, DIFF_STATE_CHANGED, DIFF_SERVICE_CHANGED],
+        default=DIFF_NEW,
+    )
+    out = df.reset_index(drop=True)
+    out[DIFF_COLUMN] = status
+
+    closed = baseline.loc[~_key_isin(base, cur, DIFF_KEY_COLUMNS)]
+    if len(closed):
+        # 按两者列的并集拼接：基线独有的列（如当前结果没有的 端口原文）在已关闭行上保留
+        closed = closed.assign(**{DIFF_COLUMN: DIFF_CLOSED})
+        out = pd.concat([out, closed], ignore_index=True)
+        # 基线里没有的附加列（如“范围”）在已关闭行上留空
+        for col in out.columns.difference(closed.columns):
+            out[col] = out[col].astype(object).where(out[col].notna(), "")
+    return out
+
+# ===========================
+# 运行统计（--stats-json / --profile）：各阶段耗时、CPU、行数与峰值内存
+# ===========================
+STATS_STAGES = ["load_baseline", "parse", "merge_xml", "to_frame", "scope_tag", "auto_dedup",
+                "diff_baseline", "mark_dangerous", "save_report", "lite_report", "follow"]
+
+def peak_rss_mb(children=False):
+    """进程（或已回收子进程中最大的）峰值 RSS，单位 MB；Unix 用 resource，Windows 需 psutil，都不可用时返回 None"""
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+        # Linux 单位为 KB，macOS 为字节
+        return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        if children:
+            return None
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+def children_cpu_seconds():
+    """已回收子进程（并行解析的 worker）累计的 CPU 时间；不支持时返回 None"""
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+    except ImportError:
+        return None
+
+class _NullStage:
+    """统计关闭时使用的空阶段：进入/退出不做任何事，行数赋值直接丢弃"""
+    __slots__ = ("rows_in", "rows_out")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """一个已开启统计的阶段：记录墙钟/CPU 时间与行数，按需用 cProfile 剖析"""
+    def __init__(self, stats, name, rows_in):
+        self.stats = stats
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self._profiler = None
+
+    def __enter__(self):
+        if self.name == self.stats.profile_stage:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self._child_cpu = children_cpu_seconds()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        if self._profiler:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler:
+            self._profiler.disable()
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        child_cpu = children_cpu_seconds()
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        record = {
+            "stage": self.name,
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_sec": round(rows / wall) if rows and wall > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if child_cpu is not None and child_cpu > self._child_cpu:
+            record["child_cpu_seconds"] = round(child_cpu - self._child_cpu, 4)
+        if exc_type is not None:
+            record["error"] = repr(exc)
+        self.stats.stages.append(record)
+        if self._profiler:
+            self.stats.dump_profile(self._profiler)
+        return False
+
+class RunStats:
+    """
+    按阶段收集运行统计。未开启时 stage() 返回共享的空上下文，
+    主流程中的统计代码只剩一次方法调用与几次属性赋值。
+    """
+    def __init__(self, enabled=False, profile_stage=None, profile_path=None):
+        self.enabled = enabled or profile_stage is not None
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path
+        self.stages = []
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def stage(self, name, rows_in=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows_in)
+
+    def dump_profile(self, profiler):
+        import io
+        import pstats
+        profiler.dump_stats(self.profile_path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+        logger.info(f"阶段 {self.profile_stage} 的 cProfile 结果已写入 {self.profile_path}（python -m pstats 查看）")
+        logger.debug(out.getvalue())
+
+    def summary(self):
+        return {
+            "argv": sys.argv[1:],
+            "wall_seconds": round(time.perf_counter() - self._wall, 4),
+            "cpu_seconds": round(time.process_time() - self._cpu, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(children=True),
+            "profile": self.profile_path if self.profile_stage else None,
+            "stages": self.stages,
+        }
+
+    def log_table(self):
+        for s in self.stages:
+            rows = f"{s['rows_in'] if s['rows_in'] is not None else '-'} -> {s['rows_out'] if s['rows_out'] is not None else '-'}"
+            logger.info(f"[统计] {s['stage']:<15} 墙钟 {s['wall_seconds']:>9.3f}s  CPU {s['cpu_seconds']:>9.3f}s  "
+                        f"行 {rows:<20} 峰值 RSS {s['peak_rss_mb']} MB")
+
+    def write(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        logger.info(f"运行统计已写入 {file_path}")
+
+# ===========================
+# 目录监视（--watch）：轮询目录，只解析新增/变化的文件，增量刷新报表
+# ===========================
+WATCH_TABLE_EXTS = (".csv", ".xlsx", ".xls")
+
+def scan_watch_dir(directory, exclude=()):
+    """
+    列出目录中的输入文件及其 (大小, mtime_ns)：表格在前、XML 在后，各自按文件名排序。
+    跳过 exclude 中的文件（输出报表、合并 XML、缓存库）以及隐藏文件和 Excel 锁文件（~$ 开头）。
+    """
+    excluded = {os.path.abspath(p) for p in exclude if p}
+    tables, xmls = {}, {}
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.name.startswith((".", "~$")) or os.path.abspath(entry.path) in excluded:
+            continue
+        lower = entry.name.lower()
+        if lower.endswith(".xml"):
+            target = xmls
+        elif lower.endswith(WATCH_TABLE_EXTS):
+            target = tables
+        else:
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        if entry.is_file():
+            target[("xml" if target is xmls else "table", entry.path)] = (st.st_size, st.st_mtime_ns)
+    return {**tables, **xmls}
+
+def watch_inputs(tables, directory, exclude=()):
+    """--input 指定的表格（存在的，排在最前）加上监视目录中的文件，返回 {source: (大小, mtime_ns)}"""
+    scanned = scan_watch_dir(directory, exclude)
+    in_dir = {os.path.abspath(path) for _, path in scanned}
+    current = {}
+    for path in tables:
+        if os.path.abspath(path) in in_dir:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        current[("table", path)] = (st.st_size, st.st_mtime_ns)
+    current.update(scanned)
+    return current
+
+class WatchState:
+    """
+    监视模式的常驻状态：每个文件的解析批次（按首次出现的顺序）与持续的去重结果。
+    只有新增文件时直接把新批次过一遍去重追加到结果末尾；有文件被修改或删除时，
+    按原顺序用已缓存的批次重建去重结果（不重新解析），两种方式得到的结果一致。
+    """
+    def __init__(self, scope=None, extra_columns=()):
+        self.scope = scope
+        self.extra_columns = extra_columns
+        self.batches = {}
+        self.records = RecordColumns(extra_columns)
+        self.deduper = StreamingDeduper()
+        self._dirty = False
+
+    def update(self, source, batch):
+        if self.scope is not None:
+            batch = self.scope.filter_batch(batch)
+        if source in self.batches:
+            self._dirty = True
+        elif not self._dirty:
+            self.records.extend(self.deduper.filter_columns(batch))
+        self.batches[source] = batch
+
+    def remove(self, source):
+        if self.batches.pop(source, None) is not None:
+            self._dirty = True
+
+    def result(self):
+        if self._dirty:
+            self.records = RecordColumns(self.extra_columns)
+            self.deduper = StreamingDeduper()
+            for batch in self.batches.values():
+                self.records.extend(self.deduper.filter_columns(batch))
+            self._dirty = False
+        return self.records
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def watch_directory(directory, output_file, fmt, args, scope=None, baseline=None, cache=None, stats=None,
+                    fields=None):
+    """
+    每隔 interval 秒扫描目录；文件集合或某个文件的 (大小, mtime) 变化后，等到连续 debounce 秒
+    不再变化（避免读到写了一半的文件），只解析新增/变化的文件、移除已删除文件的批次，
+    然后重写报表（原子替换）。Ctrl+C 结束。
+    """
+    exclude = [output_file, args.temp_xml, cache.db_path if cache is not None else None]
+    state = WatchState(scope if scope is not None and args.scope_action == "drop" else None,
+                       fields.columns if fields else ())
+    known = {}
+    last_seen = None
+    changed_at = 0.0
+    jobs = max(1, args.jobs)
+    # 作为后台服务运行时通常用 SIGTERM 停止，与 Ctrl+C 一样正常收尾
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    logger.info(f"开始监视目录 {directory}（每 {args.watch_interval} 秒扫描，Ctrl+C 结束）")
+    try:
+        while True:
+            current = watch_inputs(args.input, directory, exclude)
+            now = time.monotonic()
+            if current != last_seen:
+                last_seen = current
+                changed_at = now
+            if current != known and now - changed_at >= args.debounce:
+                started = time.perf_counter()
+                changed = [s for s, sig in current.items() if known.get(s) != sig]
+                removed = [s for s in known if s not in current]
+                for source in removed:
+                    state.remove(source)
+                if changed:
+                    for source, batch in iter_parsed_sources(changed, jobs=jobs, verbose=args.verbose, cache=cache,
+                                                              fields=fields):
+                        state.update(source, batch)
+                if cache is not None:
+                    cache.commit()
+                known = current
+                records = state.result()
+                logger.info(f"检测到 {len(changed)} 个新增/变化、{len(removed)} 个删除的文件，当前 {len(records)} 行")
+                if len(records):
+                    build_report(records, output_file, fmt, args, scope=scope, baseline=baseline, stats=stats)
+                else:
+                    logger.warning("目录中暂无可解析数据")
+                logger.info(f"增量刷新完成，用时 {time.perf_counter() - started:.2f} 秒")
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        logger.info("已停止监视")
+
 # ===========================
 # 主函数
 # ===========================
 def main():
-    global logger, _COLOR
+    global logger, _COLOR, danger_rules
     parser = argparse.ArgumentParser(description='合并 Nmap XML 和 Excel/CSV 扫描结果，生成端口调研表，并打印作者横幅')
     parser.add_argument('--no-unicode', dest='no_unicode', action='store_true',
                         help='强制使用 ASCII 框（不使用 Unicode 盒绘字符）')
     parser.add_argument('--margin', type=int, default=0, help='横幅左侧外边距空格数（默认 0）')
     parser.add_argument('--pad', type=int, default=1, help='横幅内部左右边距（默认 1）')
-    parser.add_argument('--input', '-i', default="开放端口.xlsx", help='输入 Excel/CSV 文件路径（默认 开放端口.xlsx）')
-    parser.add_argument('--output', '-o', default="端口调研表.xlsx", help='输出文件名（默认 端口调研表.xlsx）')
-    parser.add_argument('--temp-xml', default="out.xml", help='临时合并的 XML 文件名（默认 out.xml）')
-    parser.add_argument('--cleanup', action='store_true', help='处理完成后删除临时 out.xml')
+    parser.add_argument('--input', '-i', nargs='+', default=["开放端口.xlsx"], help='输入 Excel/CSV 文件路径，可指定多个（默认 开放端口.xlsx）')
+    parser.add_argument('--output', '-o', default=None, help='输出文件名（默认 端口调研表.<格式扩展名>）')
+    parser.add_argument('--format', '-f', choices=list(OUTPUT_FORMATS), default=None,
+                        help='输出格式（默认按输出文件扩展名推断，否则 xlsx）')
+    parser.add_argument('--temp-xml', default="out.xml", help='合并 XML 的文件名（默认 out.xml，作为输入时始终被忽略）')
+    parser.add_argument('--merge-xml', action='store_true', help='额外写出合并后的 XML（--temp-xml 指定路径），默认不写')
+    parser.add_argument('--cleanup', action='store_true', help='处理完成后删除本次写出的合并 XML（配合 --merge-xml；未写出时不删除任何文件）')
     parser.add_argument('--no-color', action='store_true', help='禁用颜色输出')
     parser.add_argument('--verbose', action='store_true', help='开启详细日志(DEBUG)')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行解析输入文件的进程数（默认 1，即串行）')
+    parser.add_argument('--scope', help='范围文件（CIDR / 区间 / 单个 IP，每行一个），只保留命中的 IP')
+    parser.add_argument('--exclude', help='排除文件（格式同 --scope），命中的 IP 视为范围外')
+    parser.add_argument('--scope-action', choices=['drop', 'tag'], default='drop',
+                        help='范围外记录的处理方式：drop 丢弃（默认），tag 保留并在“范围”列标注')
+    parser.add_argument('--cache', nargs='?', const='', default=None,
+                        help='启用解析缓存（SQLite），未变化的文件直接复用上次结果；不带路径时放在输出文件旁（<输出>.cache.sqlite）')
+    parser.add_argument('--watch', metavar='DIR',
+                        help='常驻监视目录：新增或变化的 XML/CSV/XLSX 才解析，去重结果常驻内存，变化后重写报表（Ctrl+C 结束）')
+    parser.add_argument('--watch-interval', type=float, default=5, help='监视模式扫描目录的间隔秒数（默认 5）')
+    parser.add_argument('--debounce', type=float, default=2,
+                        help='监视模式下文件连续多少秒不再变化才开始解析（默认 2，避免读到写了一半的文件）')
+    parser.add_argument('--follow', metavar='FILE',
+                        help='跟随仍在增长的 Nmap -oX 文件（- 表示标准输入，如 nmap -oX - ... | python nmap.py --follow -），'
+                             '每个 host 完成即写出（csv/jsonl 逐行追加，xlsx 定期快照）；不读取 --input 与目录中的其它 XML')
+    parser.add_argument('--follow-timeout', type=float, default=0,
+                        help='跟随文件时超过该秒数没有新内容即结束（默认 0，一直等待直到 XML 结束或 Ctrl+C）')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='跟随文件时轮询新内容的间隔秒数（默认 1）')
+    parser.add_argument('--snapshot-interval', type=float, default=30,
+                        help='跟随模式输出 xlsx 时重写快照的最小间隔秒数（默认 30）')
+    parser.add_argument('--engine', choices=['auto', 'pandas', 'lite'], default='auto',
+                        help=f'后处理方式：lite 不导入 pandas、逐行去重标注并流式写出（仅 xlsx/csv/jsonl，不支持 --baseline/--scope）；'
+                             f'auto（默认）在结果不超过 {LITE_MAX_ROWS} 行时用 lite，否则用 pandas')
+    parser.add_argument('--stats-json', metavar='PATH', help='把各阶段耗时、CPU 时间、行数与峰值内存写入 JSON 文件')
+    parser.add_argument('--profile', nargs='?', const='parse', choices=STATS_STAGES, default=None,
+                        help='用 cProfile 剖析指定阶段（默认 parse），结果写到 <输出>.<阶段>.prof；并行解析时只含主进程')
+    parser.add_argument('--baseline', help='与上一次的报表（xlsx/csv/jsonl/parquet/feather）对比，在“变化”列标注新增/已关闭/服务变更/状态变更')
+    parser.add_argument('--fields', help='从 XML 额外提取的字段，逗号分隔：product,version,extrainfo,hostname,os,script:<脚本ID>'
+                                         '（如 script:http-title）；只访问请求的子树，未请求的脚本输出不会被读取')
+    parser.add_argument('--rules', metavar='FILE',
+                        help='暴露面规则文件（YAML/JSON）：端口/端口区间、协议、服务模式、风险等级、整改建议；'
+                             '不指定时使用脚本内置的 dangerous_ports / dangerous_services')
     args = parser.parse_args()
+    if args.watch and args.follow:
+        parser.error("--watch 与 --follow 不能同时使用")
+    fields = None
+    if args.fields:
+        try:
+            fields = FieldProjection(args.fields) or None
+        except ValueError as e:
+            parser.error(str(e))
 
     # 重新创建 logger（使用 --verbose）
     logger = make_logger(args.verbose)
@@ -473,54 +2629,219 @@ def main():
 
     print_banner(use_unicode=not args.no_unicode, outer_margin=args.margin, inner_pad=max(0, args.pad))
 
-    all_results = []
+    if args.rules:
+        try:
+            danger_rules = load_rules(args.rules)
+        except Exception as e:
+            logger.error(f"读取规则文件 {args.rules} 失败: {e}")
+            return
+        logger.info(f"已加载 {len(danger_rules.rules)} 条规则: {args.rules}")
+
+    fmt = detect_format(args.output or "", args.format)
+    output_file = args.output or f"端口调研表{OUTPUT_FORMATS[fmt]}"
+    if fmt in ARROW_FORMATS and importlib.util.find_spec("pyarrow") is None:
+        logger.error(f"输出 {fmt} 需要安装 pyarrow（pip install pyarrow）")
+        return
+
+    if args.follow:
+        unsupported = lite_unsupported(fmt, args.baseline)
+        if unsupported is None and args.scope_action == "tag" and (args.scope or args.exclude):
+            unsupported = "--scope-action tag"
+        if unsupported:
+            logger.error(f"--follow 不支持 {unsupported}")
+            return
+        if args.follow != "-" and not os.path.exists(args.follow):
+            logger.error(f"文件不存在: {args.follow}")
+            return
 
-    # 第一步：合并 XML（如果目录下存在 .xml 文件）
-    merged_xml = merge_all_xml(args.temp_xml)
+    stats = RunStats(enabled=bool(args.stats_json), profile_stage=args.profile,
+                     profile_path=f"{output_file}.{args.profile}.prof" if args.profile else None)
 
-    # 第二步：解析 Excel/CSV（支持指定输入文件）
-    input_file = args.input
-    logger.info(f"解析表格文件: {input_file}")
-    all_results.extend(parse_table(input_file))
+    baseline = None
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            logger.error(f"基线文件不存在: {args.baseline}")
+            return
+        with stats.stage("load_baseline") as st:
+            baseline = load_baseline(args.baseline)
+            st.rows_out = len(baseline)
+        logger.info(f"已读取基线 {args.baseline}，共 {len(baseline)} 行")
 
-    # 第三步：解析 out.xml
-    if merged_xml:
-        all_results.extend(parse_nmap_xml(merged_xml))
+    all_records = RecordColumns(fields.columns if fields else ())
+    # 解析结果边到达边去重，重复行不再进入内存中的汇总表
+    deduper = StreamingDeduper()
 
-    if not all_results:
+    # 范围过滤：在去重之前完成，范围外的记录不会进入后续阶段
+    scope = None
+    if args.scope or args.exclude:
+        try:
+            scope = ScopeFilter(ScopeIndex.from_file(args.scope) if args.scope else None,
+                                ScopeIndex.from_file(args.exclude) if args.exclude else None)
+        except OSError as e:
+            logger.error(f"读取范围文件失败: {e}")
+            return
+    drop_out_of_scope = scope is not None and args.scope_action == "drop"
+
+    if args.follow:
+        with stats.stage("follow") as st:
+            st.rows_out = follow_nmap_xml(args.follow, output_file, fmt, scope, poll_interval=args.poll_interval,
+                                          timeout=args.follow_timeout, snapshot_interval=args.snapshot_interval,
+                                          fields=fields)
+        if scope is not None:
+            logger.info(f"范围过滤已丢弃 {scope.dropped} 行范围外数据")
+        finish_run(args, stats, None)
+        return
+
+    if args.watch:
+        if not os.path.isdir(args.watch):
+            logger.error(f"目录不存在: {args.watch}")
+            return
+        if args.merge_xml:
+            logger.warning("监视模式不写出合并 XML，忽略 --merge-xml")
+        cache = open_parse_cache(args.cache, output_file, fields)
+        try:
+            watch_directory(args.watch, output_file, fmt, args, scope=scope, baseline=baseline, cache=cache, stats=stats,
+                            fields=fields)
+        finally:
+            if cache is not None:
+                cache.close()
+        finish_run(args, stats, None)
+        return
+
+    # 第一步：查找目录下的 .xml 文件（排除合并输出，避免上次遗留的 out.xml 重复计入）
+    xml_files = find_xml_files(".", exclude=[args.temp_xml])
+    if not xml_files:
+        logger.warning("没有找到 XML 文件，仅解析表格。")
+
+    # 第二步：按顺序解析 Excel/CSV（支持指定多个输入文件）与各 XML，结果按输入顺序拼接
+    logger.info(f"解析表格文件: {', '.join(args.input)}")
+    sources = [("table", f) for f in args.input] + [("xml", f) for f in xml_files]
+    jobs = max(1, args.jobs)
+
+    cache = open_parse_cache(args.cache, output_file, fields)
+
+    # 串行且不使用缓存时，--merge-xml 边解析边写出合并 XML；
+    # 并行（host 节点不回传主进程）或命中缓存（文件不再解析）时，解析后单独流式合并
+    single_pass_merge = jobs <= 1 and cache is None
+    merger = MergedXmlWriter(args.temp_xml) if args.merge_xml and xml_files and single_pass_merge else None
+    parsed_rows = 0
+    try:
+        with stats.stage("parse") as st:
+            for _, batch in iter_parsed_sources(sources, jobs=jobs, verbose=args.verbose,
+                                                on_node=merger.write if merger else None, cache=cache, fields=fields):
+                parsed_rows += len(batch)
+                if drop_out_of_scope:
+                    batch = scope.filter_batch(batch)
+                all_records.extend(deduper.filter_columns(batch))
+            st.rows_in, st.rows_out = parsed_rows, len(all_records)
+    except BaseException:
+        if merger:
+            merger.abort()
+        raise
+    finally:
+        if cache is not None:
+            cache.close()
+    merged_xml = merger.close() if merger else None
+    if args.merge_xml and xml_files and not single_pass_merge:
+        with stats.stage("merge_xml"):
+            merged_xml = merge_all_xml(args.temp_xml, xml_files)
+
+    if not len(all_records):
         logger.error("未找到可解析数据。")
         return
+    if deduper.dropped:
+        logger.info(f"流式去重已丢弃 {deduper.dropped} 行重复数据")
+    if drop_out_of_scope:
+        logger.info(f"范围过滤已丢弃 {scope.dropped} 行范围外数据")
+
+    build_report(all_records, output_file, fmt, args, scope=scope, baseline=baseline, stats=stats, release=True)
+    finish_run(args, stats, merged_xml)
 
-    df = pd.DataFrame(all_results)
+def build_report(all_records, output_file, fmt, args, scope=None, baseline=None, stats=None, release=False):
+    """
+    已去重的解析结果 -> 报表：范围标注、去重、基线对比、危险标注，原子写出。
+    结果不大且不需要 pandas 专属功能时走轻量路径。release=True 时转成 DataFrame 后即释放 all_records。
+    """
+    stats = stats or RunStats()
+    # 轻量路径：结果不大且不需要 pandas 专属功能时，逐行去重、标注并直接流式写出
+    lite = False
+    if args.engine != "pandas":
+        reason = lite_unsupported(fmt, baseline, scope)
+        if reason is None:
+            lite = args.engine == "lite" or len(all_records) <= LITE_MAX_ROWS
+        elif args.engine == "lite":
+            logger.warning(f"轻量路径不支持 {reason}，改用 pandas 处理")
+    if lite:
+        with stats.stage("lite_report", rows_in=len(all_records)) as st:
+            st.rows_out = save_rows_report(all_records.records(), output_file, fmt, list(all_records.extra))
+        return
+
+    with stats.stage("to_frame", rows_in=len(all_records)) as st:
+        df = all_records.to_frame()
+        st.rows_out = len(df)
+    if release:
+        all_records.clear()
+    if scope is not None and args.scope_action == "tag":
+        with stats.stage("scope_tag", rows_in=len(df)) as st:
+            df = scope.tag(df)
+            st.rows_out = len(df)
+        logger.info(f"范围外 {int((df[SCOPE_COLUMN] == OUT_OF_SCOPE_LABEL).sum())} 行，已在“{SCOPE_COLUMN}”列标注")
 
     # 去重
-    df, mode = auto_dedup(df)
+    with stats.stage("auto_dedup", rows_in=len(df)) as st:
+        df, mode = auto_dedup(df)
+        st.rows_out = len(df)
     logger.info(f"自动去重模式：{mode}，最终 {len(df)} 行")
 
+    # 与基线对比（在标注危险之前，已关闭的记录同样会被标注）
+    if baseline is not None:
+        with stats.stage("diff_baseline", rows_in=len(df)) as st:
+            df = diff_against_baseline(df, baseline)
+            st.rows_out = len(df)
+        counts = df[DIFF_COLUMN].value_counts()
+        logger.info("与基线对比：" + "，".join(f"{k} {int(counts.get(k, 0))} 行" for k in
+                    (DIFF_NEW, DIFF_CLOSED, DIFF_SERVICE_CHANGED, DIFF_STATE_CHANGED, DIFF_UNCHANGED)))
+
     # 标注危险
-    df = mark_dangerous(df)
+    with stats.stage("mark_dangerous", rows_in=len(df)) as st:
+        df = mark_dangerous(df)
+        st.rows_out = len(df)
 
-    output_file = args.output
     # 原子写入：先写临时文件再替换
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=".xlsx")
-    os.close(tmp_fd)
+    with stats.stage("save_report", rows_in=len(df)):
+        save_report(df, output_file, fmt)
+
+def open_parse_cache(cache_arg, output_file, fields=None):
+    """按 --cache 打开解析缓存（未启用或打开失败返回 None）；--fields 不同的解析结果互不复用"""
+    if cache_arg is None:
+        return None
+    cache_path = cache_arg or f"{output_file}.cache.sqlite"
     try:
-        df.to_excel(tmp_path, index=False)
-        format_excel(tmp_path)
-        # 替换目标文件（原子）
-        shutil.move(tmp_path, output_file)
-        logger.info(f"处理完成，结果保存为 {output_file}")
+        cache = ParseCache(cache_path, f"{CACHE_VERSION}:{fields.variant}" if fields else CACHE_VERSION)
+        pruned = cache.prune()
+        if pruned:
+            logger.info(f"已清理 {pruned} 条失效缓存")
+        return cache
     except Exception as e:
-        logger.error(f"保存输出文件失败: {e}")
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-    # cleanup 临时 xml
-    if args.cleanup and merged_xml and os.path.exists(merged_xml):
+        logger.error(f"打开解析缓存 {cache_path} 失败，本次不使用缓存: {e}")
+        return None
+
+def finish_run(args, stats, merged_xml):
+    """收尾：按需删除本次写出的合并 XML，输出运行统计"""
+    # cleanup 合并 xml：只删除本次运行写出的文件，已有的同名文件（可能是 nmap -oX 的结果）不动
+    if args.cleanup and not merged_xml:
+        logger.debug(f"本次未写出合并 XML，--cleanup 不删除任何文件（{args.temp_xml} 保持不变）")
+    elif args.cleanup and os.path.exists(merged_xml):
         try:
             os.remove(merged_xml)
             logger.info(f"已删除临时文件: {merged_xml}")
         except Exception as e:
             logger.debug(f"删除临时文件失败: {e}")
 
+    if stats.enabled:
+        stats.log_table()
+    if args.stats_json:
+        stats.write(args.stats_json)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,56 @@
+"""
+--baseline：每周报表作为下一周的基线链式对比。
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nmap  # noqa: E402
+
+HEADER = "IP,端口/协议,状态,服务\n"
+BOTH = HEADER + "10.0.0.1,21/tcp,open,ftp\n10.0.0.1,22/tcp,open,ssh\n"
+ONLY_SSH = HEADER + "10.0.0.1,22/tcp,open,ssh\n"
+
+
+def run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["nmap.py", *argv])
+    nmap.main()
+
+
+def changes(path):
+    df = pd.read_excel(path) if path.endswith(".xlsx") else pd.read_csv(path, encoding="utf-8-sig")
+    return dict(zip(df["端口/协议"], df[nmap.DIFF_COLUMN]))
+
+
+@pytest.mark.parametrize("ext", [".csv", ".xlsx"])
+def test_chained_baselines(tmp_path, monkeypatch, ext):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "both.csv").write_text(BOTH, encoding="utf-8")
+    (tmp_path / "ssh.csv").write_text(ONLY_SSH, encoding="utf-8")
+
+    run(monkeypatch, "-i", "both.csv", "-o", f"week1{ext}")
+    run(monkeypatch, "-i", "ssh.csv", "-o", f"week2{ext}", "--baseline", f"week1{ext}")
+    assert changes(f"week2{ext}") == {"22/tcp": nmap.DIFF_UNCHANGED, "21/tcp": nmap.DIFF_CLOSED}
+
+    # 上周的“已关闭”行不是基线的一部分：不再重复报告
+    run(monkeypatch, "-i", "ssh.csv", "-o", f"week3{ext}", "--baseline", f"week2{ext}")
+    assert changes(f"week3{ext}") == {"22/tcp": nmap.DIFF_UNCHANGED}
+
+    # 之后重新开放的端口为新增
+    run(monkeypatch, "-i", "both.csv", "-o", f"week4{ext}", "--baseline", f"week3{ext}")
+    assert changes(f"week4{ext}") == {"21/tcp": nmap.DIFF_NEW, "22/tcp": nmap.DIFF_UNCHANGED}
+
+
+def test_load_baseline_drops_closed_rows(tmp_path):
+    path = tmp_path / "report.csv"
+    path.write_text("IP,端口/协议,状态,服务,变化\n"
+                    "10.0.0.1,22/tcp,open,ssh,未变化\n"
+                    "10.0.0.1,21/tcp,open,ftp,已关闭\n"
+                    "10.0.0.2,80/tcp,open,http,新增\n", encoding="utf-8")
+    baseline = nmap.load_baseline(str(path))
+    assert nmap.DIFF_COLUMN not in baseline.columns
+    assert sorted(zip(baseline["IP"], baseline["端口"])) == [("10.0.0.1", 22), ("10.0.0.2", 80)]
@@ -0,0 +1,35 @@
+"""
+--cleanup 只删除本次运行写出的合并 XML。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nmap  # noqa: E402
+
+TABLE = "IP,端口/协议,状态,服务\n10.0.0.1,22/tcp,open,ssh\n"
+SCAN = "<nmaprun></nmaprun>\n"
+
+
+def run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["nmap.py", *argv])
+    nmap.main()
+
+
+def test_cleanup_keeps_existing_xml_without_merge(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text(TABLE, encoding="utf-8")
+    (tmp_path / "out.xml").write_text(SCAN, encoding="utf-8")
+    run(monkeypatch, "--cleanup", "-i", "a.csv", "-o", "r.csv")
+    assert (tmp_path / "r.csv").exists()
+    assert (tmp_path / "out.xml").read_text(encoding="utf-8") == SCAN
+
+
+def test_cleanup_removes_merged_xml(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text(TABLE, encoding="utf-8")
+    (tmp_path / "scan.xml").write_text(SCAN, encoding="utf-8")
+    run(monkeypatch, "--merge-xml", "--cleanup", "-i", "a.csv", "-o", "r.csv")
+    assert not (tmp_path / "out.xml").exists()
+    assert (tmp_path / "scan.xml").exists()
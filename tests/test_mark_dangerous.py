@@ -0,0 +1,269 @@
+"""
+mark_dangerous 与原始逐行 check(row) 的等价性，以及 --rules 规则引擎（RuleSet / load_rules）。
+"""
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nmap  # noqa: E402
+
+
+def check(row):
+    """原实现（逐行 apply），作为标注结果的参照"""
+    port = None
+    try:
+        port_str = str(row.get("端口/协议", "")).split("/")[0]
+        if port_str and re.match(r"^\d+$", port_str):
+            port = int(port_str)
+    except Exception:
+        port = None
+    service = str(row.get("服务", "")).strip().lower()
+    service_tokens = set(re.split(r'[\s/_\-]+', service))
+    if (port in nmap.dangerous_ports) or (service and (service in nmap.dangerous_services
+                                                       or bool(service_tokens & nmap.dangerous_services))):
+        return "危险端口不允许对外开放"
+    return ""
+
+
+def baseline_normalize(value):
+    """原 auto_dedup 在标注前对各字段做的归一化"""
+    return re.sub(r'\s+', ' ', str(value)).strip().lower()
+
+
+# (端口/协议, 服务)
+EDGE_ROWS = [
+    (np.nan, np.nan),
+    (None, None),
+    ("", ""),
+    ("21/tcp", ""),
+    ("0021/tcp", ""),
+    ("２１/tcp", ""),
+    (" 21/tcp", "unknown"),
+    ("80-90/tcp", ""),
+    ("80-90/tcp", "ftp"),
+    ("99999/tcp", ""),
+    ("99999/tcp", "vnc"),
+    ("65535/udp", ""),
+    ("/tcp", ""),
+    ("8080/tcp", "vnc服务"),
+    ("8080/tcp", "vnc 服务"),
+    ("8080/tcp", "sybase/db2"),
+    ("8080/tcp", "sybase"),
+    ("8080/tcp", "linux rexec"),
+    ("8080/tcp", "linux-rexec"),
+    ("8080/tcp", " MySQL "),
+    ("8080/tcp", "HTTP"),
+    ("8443/tcp", "http-proxy"),
+    ("8443/tcp", "ssl/https"),
+    ("8443/tcp", "nan"),
+    ("22/tcp", "ssh"),
+    ("3389/tcp", "ms-wbt-server"),
+    ("53/udp", "domain"),
+]
+
+
+def display_frame():
+    return pd.DataFrame(EDGE_ROWS, columns=["端口/协议", "服务"])
+
+
+def test_display_frame_matches_check():
+    df = display_frame()
+    expected = df.apply(check, axis=1).tolist()
+    assert nmap.mark_dangerous(df.copy())[nmap.DANGER_COLUMN].tolist() == expected
+
+
+def test_parsed_frame_matches_check():
+    """解析结果的 端口 / 协议 / 端口原文 分列形式与展示形式标注一致"""
+    df = display_frame()
+    expected = df.apply(check, axis=1).tolist()
+    ports, protocols, texts = [], [], []
+    for value in df["端口/协议"]:
+        text, _, proto = str(value).partition("/") if isinstance(value, str) else ("", "", "")
+        port = int(text) if text.isascii() and text.isdigit() and int(text) < nmap.PORT_SPACE else None
+        ports.append(port)
+        protocols.append(proto)
+        texts.append(None if port is not None or not text else text)
+    parsed = pd.DataFrame({
+        "端口": pd.array(ports, dtype="Int64"),
+        "协议": protocols,
+        "服务": df["服务"],
+        nmap.PORT_TEXT_COLUMN: texts,
+    })
+    assert nmap.mark_dangerous(parsed)[nmap.DANGER_COLUMN].tolist() == expected
+
+
+def test_dedup_pipeline_matches_check():
+    """auto_dedup -> mark_dangerous 与原流程（归一化后逐行 check）一致"""
+    df = display_frame()
+    df.insert(0, "IP", [f"10.0.0.{i}" for i in range(len(df))])
+    expected = df.map(baseline_normalize).apply(check, axis=1).tolist()
+    deduped, _ = nmap.auto_dedup(df.copy())
+    assert len(deduped) == len(df)
+    assert nmap.mark_dangerous(deduped)[nmap.DANGER_COLUMN].tolist() == expected
+
+
+def test_lite_rows_match_check():
+    """轻量路径在标注前同样做了归一化（如 " 21" -> "21"），参照归一化后的 check"""
+    expected = display_frame().map(baseline_normalize).apply(check, axis=1).tolist()
+    records = []
+    for i, (value, service) in enumerate(EDGE_ROWS):
+        text, _, proto = value.partition("/") if isinstance(value, str) else ("", "", "")
+        records.append(nmap.PortRecord(f"10.0.0.{i}", protocol=proto,
+                                       service=service if isinstance(service, str) else "",
+                                       port_text=text or None))
+    rows = list(nmap.iter_report_rows(records))
+    assert [row[-1] for row in rows] == expected
+
+
+def test_mark_dangerous_keeps_existing_columns():
+    df = display_frame()
+    out = nmap.mark_dangerous(df.copy())
+    assert list(out.columns) == ["端口/协议", "服务", nmap.DANGER_COLUMN]
+    assert len(out) == len(df)
+
+
+# ---------------------------------------------------------------------------
+# --rules
+# ---------------------------------------------------------------------------
+RULES = {
+    "label": "需整改",
+    "include_default": True,
+    "rules": [
+        {"name": "DNS 放大", "ports": [53], "protocol": "udp",
+         "severity": "高", "remediation": "关闭对外递归解析"},
+        {"name": "VNC", "ports": ["5900-5999"], "services": ["vnc*"],
+         "severity": "高", "remediation": "仅允许 VPN 访问"},
+        {"name": "Web 管理", "services": ["*-proxy", "http-alt"], "protocol": "tcp",
+         "severity": "中", "label": "确认是否必要"},
+    ],
+}
+
+# (端口/协议, 服务, 标注, 风险等级, 整改建议)
+RULE_CASES = [
+    ("53/udp", "domain", "需整改", "高", "关闭对外递归解析"),
+    ("53/tcp", "domain", "需整改", "", ""),             # 只命中内置规则
+    ("5950/tcp", "unknown", "需整改", "高", "仅允许 VPN 访问"),
+    ("6000/tcp", "vnc-http", "需整改", "高", "仅允许 VPN 访问"),
+    ("8080/tcp", "http-proxy", "确认是否必要", "中", ""),
+    ("8080/udp", "http-proxy", "需整改", "", ""),        # 非 tcp：落到内置规则（http 分词）
+    ("8081/tcp", "squid-proxy", "确认是否必要", "中", ""),
+    ("8081/udp", "squid-proxy", "", "", ""),
+    ("22/tcp", "ssh", "", "", ""),
+    ("21/tcp", "ftp", "需整改", "", ""),
+    ("99999/tcp", "", "", "", ""),
+]
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def rules(rules_file, tmp_path):
+    return nmap.load_rules(rules_file, cache_dir=str(tmp_path / "cache"))
+
+
+def rules_frame():
+    return pd.DataFrame([case[:2] for case in RULE_CASES], columns=["端口/协议", "服务"])
+
+
+def test_rules_frame(rules):
+    assert rules.columns == [nmap.DANGER_COLUMN, nmap.SEVERITY_COLUMN, nmap.REMEDIATION_COLUMN]
+    out = nmap.mark_dangerous(rules_frame(), rules)
+    assert out[rules.columns].values.tolist() == [list(case[2:]) for case in RULE_CASES]
+
+
+def test_rules_lite_rows_match_frame(rules, monkeypatch):
+    monkeypatch.setattr(nmap, "danger_rules", rules)
+    records = []
+    for i, (value, service, *_) in enumerate(RULE_CASES):
+        text, _, proto = value.partition("/")
+        port = int(text) if int(text) < nmap.PORT_SPACE else nmap.NO_PORT
+        records.append(nmap.PortRecord(f"10.0.0.{i}", port=port, protocol=proto, service=service,
+                                       port_text=None if port != nmap.NO_PORT else text))
+    rows = list(nmap.iter_report_rows(records))
+    frame = nmap.mark_dangerous(rules_frame(), rules)
+    assert nmap.report_columns()[-3:] == rules.columns
+    assert [list(row[-3:]) for row in rows] == frame[rules.columns].values.tolist()
+
+
+def test_default_rules_match_check():
+    """不指定 --rules 时内置规则的标注与原实现一致，且只输出标注列"""
+    default = nmap.RuleSet.compile(nmap.default_rule_specs())
+    assert default.columns == [nmap.DANGER_COLUMN]
+    df = display_frame()
+    expected = df.apply(check, axis=1).tolist()
+    assert nmap.mark_dangerous(df.copy(), default)[nmap.DANGER_COLUMN].tolist() == expected
+
+
+def test_rules_cache_round_trip(rules_file, tmp_path, rules):
+    cache_dir = tmp_path / "cache"
+    cached = os.listdir(cache_dir)
+    assert len(cached) == 1 and cached[0].endswith(".rules")
+    again = nmap.load_rules(rules_file, cache_dir=str(cache_dir))
+    assert again.to_bytes() == rules.to_bytes()
+    restored = nmap.RuleSet.from_bytes(rules.to_bytes())
+    for value, service, *_ in RULE_CASES:
+        text, _, proto = value.partition("/")
+        port = int(text) if int(text) < nmap.PORT_SPACE else nmap.NO_PORT
+        assert restored.classify(port, proto, service) == rules.classify(port, proto, service)
+
+
+def test_rules_cache_rewritten_when_changed(rules_file, tmp_path, rules):
+    cache_dir = tmp_path / "cache"
+    with open(rules_file, "w", encoding="utf-8") as f:
+        json.dump([{"ports": "22", "severity": "低"}], f)
+    changed = nmap.load_rules(rules_file, cache_dir=str(cache_dir))
+    assert len(os.listdir(cache_dir)) == 2
+    out = nmap.mark_dangerous(pd.DataFrame({"端口/协议": ["22/tcp", "21/tcp"], "服务": ["ssh", "ftp"]}), changed)
+    assert out[nmap.DANGER_COLUMN].tolist() == [nmap.DANGER_LABEL, ""]
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="需要 POSIX 权限位")
+def test_rules_cache_ignores_writable_entry(rules_file, tmp_path, rules):
+    cache_dir = tmp_path / "cache"
+    cache_path = cache_dir / os.listdir(cache_dir)[0]
+    forged = nmap.RuleSet.compile([{"ports": "1-65535", "label": "伪造"}])
+    cache_path.write_bytes(forged.to_bytes())
+    os.chmod(cache_path, 0o666)
+    loaded = nmap.load_rules(rules_file, cache_dir=str(cache_dir))
+    assert loaded.to_bytes() == rules.to_bytes()
+
+
+def test_rules_yaml(tmp_path):
+    yaml = pytest.importorskip("yaml")
+    path = tmp_path / "rules.yaml"
+    path.write_text(yaml.safe_dump(RULES, allow_unicode=True), encoding="utf-8")
+    loaded = nmap.load_rules(str(path), cache_dir=None)
+    out = nmap.mark_dangerous(rules_frame(), loaded)
+    assert out[loaded.columns].values.tolist() == [list(case[2:]) for case in RULE_CASES]
+
+
+@pytest.mark.parametrize("specs", [
+    [{"name": "空规则"}],
+    [{"ports": "70000"}],
+    [{"ports": "90-80"}],
+    [{"ports": "abc"}],
+    [{"ports": 22, "proto": "tcp"}],
+    ["22"],
+])
+def test_invalid_rules(specs):
+    with pytest.raises(ValueError):
+        nmap.RuleSet.compile(specs)
+
+
+def test_invalid_rule_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": {"ports": 22}}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        nmap.load_rules(str(path), cache_dir=None)